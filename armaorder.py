@@ -1,8 +1,18 @@
-import numpy as np
-from cumxst import cumx
-from cumest import cumest
-import impulse_response as ir
-from arorder import ar_estimate
+from cumxst import cum3x_slices
+from arorder import hankel_spectrum
+from sweep import run
+
+def arma_estimate(sig, pcs, ar, ma, winsize):
+    """
+    ar_estimate(sig, pcs, ar, ma, winsize) and cumx(sig, pcs, 3, ma, winsize) from one pass:
+    the signal is sampled once and C3(m,0) is one of the slices of the AR table.
+        Return: (normalized singular values, C3(m,0) for -ma <= m <= ma)
+    """
+    if len(pcs) != 3:
+        raise ValueError("The ar estimate could only handle 3rd-order cumulant")
+    maxlag = 2*ar+ma-1
+    slices = cum3x_slices(sig, pcs, maxlag, winsize, 0, range(-ar, ma+1))
+    return hankel_spectrum(slices[:, maxlag:], ar, ma, ar), slices[ar, maxlag-ma:maxlag+ma+1]
 
 def arma(pcs, ar, ma, winsize, mc_round, slicing, snr, noise_type):
     """
@@ -15,45 +25,5 @@ def arma(pcs, ar, ma, winsize, mc_round, slicing, snr, noise_type):
         snr: snr level for specific data file (larger than 100 for noise free
         noice_type: white or color.
     """
-    if snr > 100:
-        f1 = open("result/ar%s_hos%d_winsize%d_slice%d_snr%d_pcs%s.csv"%(ar, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs]) ), 'w')
-        f2 = open("result/ma%s_hos%d_winsize%d_slice%d_snr%d_pcs%s.csv"%(ma, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs]) ), 'w')
-        for i in range(mc_round):
-            receive = np.load("temp/arma_data_%d.npy"%(i))[:slicing]
-            temp = ar_estimate(receive, pcs, ar, ma, winsize)
-            f1.write('%s\n' % temp)
-            print "AR - snr=+inf, ", temp
-            temp = cumx(receive, pcs, len(pcs), ma, winsize)
-            f2.write('%s\n' % temp)
-            print "MA - snr=+inf, ", temp
-
-    elif noise_type=="white":
-        f1 = open("result/ar%s_hos%d_winsize%d_slice%d_white_snr%d_pcs%s.csv"%(ar, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs]) ), 'w')
-        f2 = open("result/ma%s_hos%d_winsize%d_slice%d_white_snr%d_pcs%s.csv"%(ma, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs]) ), 'w')
-        for i in range(mc_round):
-            receive = np.load("temp/arma_data_white_%d_%d.npy"%(snr, i))[:slicing]
-            temp = ar_estimate(receive, pcs, ar, ma, winsize)
-            f1.write('%s\n' % temp)
-            print "AR - white noise, snr=%d, "%(snr), temp
-            temp = cumx(receive, pcs, len(pcs), ma, winsize)
-            f2.write('%s\n' % temp)
-            print "MA - white noise, snr=%d, "%(snr), temp
-
-    elif noise_type=="color":
-        f1 = open("result/ar%s_hos%d_winsize%d_slice%d_color_snr%d_pcs%s.csv"%(ar, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs]) ), 'w')
-        f2 = open("result/ma%s_hos%d_winsize%d_slice%d_color_snr%d_pcs%s.csv"%(ma, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs]) ), 'w')
-        for i in range(mc_round):
-            receive = np.load("temp/arma_data_color_%d_%d.npy"%(snr, i))[:slicing]
-            temp = ar_estimate(receive, pcs, ar, ma, winsize)
-            f1.write('%s\n' % temp)
-            print "AR - color noise, snr=%d, "%(snr), temp
-            temp = cumx(receive, pcs, len(pcs), ma, winsize)
-            f2.write('%s\n' % temp)
-            print "MA - color noise, snr=%d, "%(snr), temp
-
-    else:
-        print "ERROR: the noise type is wrong!!"
-    
-    f1.close()
-    f2.close()
-
+    run({'estimator': 'arma', 'pcs': pcs, 'ar': ar, 'ma': ma, 'winsize': winsize, 'realizations': mc_round, \
+            'slicing': slicing, 'snr': snr, 'noise_type': noise_type}, processes=1, resume=False)
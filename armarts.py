@@ -0,0 +1,90 @@
+import numpy as np
+from scipy.signal import lfilter
+from arrcest import arrcest, arrcestx
+from maest import RecursiveMA
+
+def inverse_filter(y, avec, block=8192):
+    """
+    The residual time-series A(z)y, one block after another.
+    The filter state is carried from block to block, so the blocks put together
+    equal lfilter(avec, [1], y); y is only read by slices and may be a memory map.
+    """
+    zi = np.zeros(len(avec)-1)
+    for start in range(0, len(y), block):
+        temp, zi = lfilter(avec, [1], y[start:start+block], zi=zi)
+        yield temp
+
+def residual_ma(blocks, q, norder, samp_seg, overlap, flag='biased', pcs=None):
+    """MA estimate from the blocks of a time-series, see maest.RecursiveMA."""
+    estimator = RecursiveMA(q, samp_seg, norder, overlap, pcs, flag)
+    for temp in blocks:
+        estimator.update(temp)
+    return estimator.estimate
+
+def segment(y, samp_seg, block):
+    """
+    Samples per segment of the residual: samp_seg, or by default one block, so that
+    the MA estimation never holds more than a segment of the residual.
+    """
+    if samp_seg > 0:
+        return samp_seg
+    return min(len(y), block)
+
+def armarts(y, p, q, norder=3, maxlag=0, samp_seg=0, overlap=0, flag='biased', block=8192):
+    """
+    ARMARTS ARMA parameter estimation via the residual time-series method:
+    the AR parameters come from arrcest, the AR part is removed by inverse
+    filtering in blocks, and the MA parameters of the residual come from maest.
+        y - time-series (vector)
+        p - AR order
+        q - MA order
+        norder - cumulant-order: 3, 4, -3 or -4, see arrcest  [default = 3]
+        maxlag - maximum lag for arrcest  [default = p+q]
+        samp_seg - samples per segment  [default: length of y for the AR part,
+                   one block for the MA part of the residual]
+        overlap - percentage overlap of segments  [default = 0]
+        flag - 'biased' or 'unbiased'  [default = 'biased']
+        block - samples inverse filtered at once  [default = 8192]
+        Return: (avec, bvec) estimated AR and MA parameter vectors
+    """
+    if abs(norder) not in (3, 4):
+        raise Exception("norder must be 3, 4, -3 or -4")
+    assert p >= 0, "AR order cannot be negative"
+    assert q >= 0, "MA order cannot be negative"
+    y = np.ravel(y)
+    avec = arrcest(y, p, q, norder, maxlag, samp_seg, overlap, flag)
+    bvec = np.ones(1)
+    if q > 0:
+        bvec = residual_ma(inverse_filter(y, avec, block), q, abs(norder), segment(y, samp_seg, block), overlap, flag)
+    return avec, bvec
+
+def armartsx(y, pcs, p, q, norder=3, maxlag=0, samp_seg=0, overlap=0, block=8192):
+    """
+    ARMARTS with the PCS cumulant estimates, see armarts, arrcestx and maest.maestx.
+        pcs - PCS coefficients, at least abs(norder) of them
+    """
+    if abs(norder) not in (3, 4):
+        raise Exception("norder must be 3, 4, -3 or -4")
+    assert p >= 0, "AR order cannot be negative"
+    assert q >= 0, "MA order cannot be negative"
+    y = np.ravel(y)
+    avec = arrcestx(y, pcs, p, q, norder, maxlag, samp_seg, overlap)
+    bvec = np.ones(1)
+    if q > 0:
+        bvec = residual_ma(inverse_filter(y, avec, block), q, abs(norder), segment(y, samp_seg, block), overlap, pcs=pcs)
+    return avec, bvec
+
+def test():
+    import scipy.io as sio
+    # ARMA(2,1) with AR [1 -0.8 0.65] and MA [1 -2], exponential input
+    y = sio.loadmat("matfile/demo/arma1.mat")['y']
+    avec, bvec = armarts(y, 2, 1, 3, 12, 128)
+    print avec
+    print bvec
+    # the default segmentation
+    print armarts(y, 2, 1, 3, 12)
+    print armartsx(y, [1,2,3], 2, 1, 3, 12)
+
+
+if __name__=="__main__":
+    test()
@@ -1,26 +1,115 @@
+import time
 import numpy as np
-from cumxst import cumx
-from cumest import cumest
-import impulse_response as ir
+from multiprocessing import Pool
+from cumxst import cum3x_slices
+from sweep import run, load
+
+def cumulant_table(sig, pcs, ar, ma, winsize):
+    """C3(l,k1) for k1 = -ar..ma (rows) and lags l = 0..2*ar+ma-1 (columns)."""
+    return cum3x_slices(sig, pcs, 2*ar+ma-1, winsize, 0, range(-ar, ma+1))[:, 2*ar+ma-1:]
+
+def hankel_spectrum(table, ar, ma, ar_max):
+    """
+    Normalized singular values of the Hankel matrix of the (ar, ma) hypothesis.
+        table - cumulants of cumulant_table for (ar_max, ma_max), ar <= ar_max and ma <= ma_max
+    """
+    rb = ma+ar+1
+    i = np.arange(ar*rb)[:, np.newaxis]
+    j = np.arange(ar)
+    # the slice k1 = -(i%rb), wrapping around to the positive slices beyond -ar
+    k1 = (ar-i%rb)%rb - ar
+    s = np.linalg.svd(table[ar_max+k1, ma+j+1+i/rb], compute_uv=False)
+    return s/s[0]
 
 def ar_estimate(sig, pcs, ar, ma, winsize):
     if len(pcs) != 3:
         raise ValueError("The ar estimate could only handle 3rd-order cumulant")
-    rb = ma+ar+1
-    m = np.zeros((rb, 2*ar+ma))
-    for p in range(rb):
-        temp = cumx(sig, pcs, 3, 2*ar+ma-1, winsize, 0, p-ar)
-        m[p,0] = temp[len(temp)/2]
-        #m[p,1:] = (temp[:len(temp)/2][::-1]+temp[len(temp)/2+1:])/2
-        m[p,1:] = temp[len(temp)/2+1:]
-    m = m.T
-    # put cumulants into Hankel matrix
-    result = np.zeros((ar*rb, ar))
-    for i in range(ar*rb):
-        for j in range(ar):
-            result[i,j] = m[ma+j+1+i/rb, ar-i%rb]
-    _, s, _ = np.linalg.svd(result)
-    return s/s[0]
+    return hankel_spectrum(cumulant_table(sig, pcs, ar, ma, winsize), ar, ma, ar)
+
+def order_spectra(sig, pcs, ar_max, ma_max, winsize):
+    """
+    Normalized singular values of every hypothesis 1 <= ar <= ar_max, 0 <= ma <= ma_max,
+    from one cumulant table of the largest hypothesis.
+        Return: dictionary {(ar, ma): ar_estimate(sig, pcs, ar, ma, winsize)}
+    """
+    if len(pcs) != 3:
+        raise ValueError("The ar estimate could only handle 3rd-order cumulant")
+    table = cumulant_table(sig, pcs, ar_max, ma_max, winsize)
+    return dict(((ar, ma), hankel_spectrum(table, ar, ma, ar_max)) \
+            for ar in range(1, ar_max+1) for ma in range(ma_max+1))
+
+# the realizations of order_search, inherited by the forked workers
+SIGNALS = None
+
+def order_task(args):
+    """The smallest normalized singular value of every ma hypothesis, for one realization and one ar."""
+    r, pcs, ar, mas, winsize = args
+    start = time.time()
+    table = cumulant_table(SIGNALS[r], pcs, ar, max(mas), winsize)
+    smin = [hankel_spectrum(table, ar, ma, ar)[-1] for ma in mas]
+    return r, smin, time.time()-start
+
+def order_search(signals, pcs, ars, mas, winsize, threshold=0.05, processes=None):
+    """
+    (ar, ma) order search over a process pool, with early termination.
+    The ar hypotheses are tried in increasing order, all the realizations of one ar
+    in parallel. A (realization, ma) pair settles at the first ar whose smallest
+    normalized singular value drops below threshold, its order being the previous ar.
+    Realizations whose pairs have all settled are not evaluated at larger ar, and
+    the search stops once every realization has settled.
+    The pair of a realization is its smallest ar order, with the smallest ma reaching it.
+        signals - (R, N) realizations; they are shared with the forked workers, not sent
+        ars - increasing ar hypotheses
+        mas - increasing ma hypotheses, all evaluated from the same cumulant table
+        threshold - bound on the smallest normalized singular value  [default = 0.05]
+        processes - size of the pool  [default: number of CPUs]
+        Return: (selected, pairs, orders, stats)
+            selected - the most frequent (ar, ma) pair
+            pairs - (R, 2) (ar, ma) pair of every realization
+            orders - (R, len(mas)) ar order of every realization and ma hypothesis,
+                     ars[-1] where the criterion had not settled
+            stats - dictionary of the wall time, the summed task time, the number
+                    of tasks run and the number of tasks in the full grid
+    """
+    global SIGNALS
+    if len(pcs) != 3:
+        raise ValueError("The ar estimate could only handle 3rd-order cumulant")
+    SIGNALS = signals
+    orders = np.ones((len(signals), len(mas)), dtype=int)*ars[-1]
+    settled = np.zeros(orders.shape, dtype=bool)
+    stats = {'wall': time.time(), 'busy': 0., 'tasks': 0, 'grid': len(signals)*len(ars)}
+
+    job = Pool(processes)
+    try:
+        previous = 0
+        for ar in ars:
+            active = [r for r in range(len(signals)) if not np.all(settled[r])]
+            if not active: break
+            # exceptions of the workers are raised here
+            for r, smin, elapsed in job.imap_unordered(order_task, [(r, pcs, ar, mas, winsize) for r in active]):
+                drop = (np.array(smin) < threshold) & ~settled[r]
+                orders[r, drop] = previous
+                settled[r] |= drop
+                stats['busy'] += elapsed
+                stats['tasks'] += 1
+            previous = ar
+        job.close()
+    except BaseException:
+        # a failed task or Ctrl-C: stop the workers instead of leaving them running
+        job.terminate()
+        raise
+    finally:
+        job.join()
+        SIGNALS = None
+
+    stats['wall'] = time.time() - stats['wall']
+    # argmin takes the first of the smallest ar, i.e. the smallest ma since mas increase
+    pairs = np.array([(orders[r].min(), mas[orders[r].argmin()]) for r in range(len(signals))], dtype=int)
+    counts = {}
+    for pair in map(tuple, pairs):
+        counts[pair] = counts.get(pair, 0) + 1
+    selected = max(sorted(counts), key=counts.get)
+    return selected, pairs, orders, stats
 
 def pcs_ar(pcs, ar, ma, winsize, mc_round, slicing, snr, noise_type):
     """
@@ -33,29 +122,29 @@ def pcs_ar(pcs, ar, ma, winsize, mc_round, slicing, snr, noise_type):
         snr: snr level for specific data file (larger than 100 for noise free
         noice_type: white or color.
     """
-    if snr > 100:
-        f = open("result/ar_ar%sma%s_hos%d_winsize%d_slice%d_snr%d_pcs%s.csv"%(ar, ma, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs]) ), 'w')
-        for i in range(mc_round):
-            receive = np.load("temp/ar_data_%d.npy"%(i))[:slicing]
-            temp = ar_estimate(receive, pcs, ar, ma, winsize)
-            f.write('%s\n' % temp)
-            print "snr=+inf, ", temp
-    elif noise_type=="white":
-        f = open("result/ar_ar%sma%s_hos%d_winsize%d_slice%d_white_snr%d_pcs%s.csv"%(ar, ma, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs]) ), 'w')
-        for i in range(mc_round):
-            receive = np.load("temp/ar_data_white_%d_%d.npy"%(snr, i))[:slicing]
-            temp = ar_estimate(receive, pcs, ar, ma, winsize)
-            f.write('%s\n' % temp)
-            print "white noise, snr=%d, "%(snr), temp
-    elif noise_type=="color":
-        f = open("result/ar_ar%sma%s_hos%d_winsize%d_slice%d_color_snr%d_pcs%s.csv"%(ar, ma, len(pcs), winsize, slicing, snr, ''.join([str(k) for k in pcs])), 'w')
-        for i in range(mc_round):
-            receive = np.load("temp/ar_data_color_%d_%d.npy"%(snr, i))[:slicing]
-            temp = ar_estimate(receive, pcs, ar, ma, winsize)
-            f.write('%s\n' % temp)
-            print "color noise, snr=%d, "%(snr), temp
-    else:
-        print "ERROR: the noise type is wrong!!"
-    f.close()
+    run({'estimator': 'ar', 'pcs': pcs, 'ar': ar, 'ma': ma, 'winsize': winsize, 'realizations': mc_round, \
+            'slicing': slicing, 'snr': snr, 'noise_type': noise_type}, processes=1, resume=False)
 
+def pcs_order(pcs, ar_max, ma_max, winsize, mc_round, slicing, snr, noise_type):
+    """
+    The spectra of all the (ar, ma) hypotheses up to (ar_max, ma_max), one cumulant table per realization.
+    Every line of the output holds ar, ma and the normalized singular values,
+    padded with zeros to ar_max values.
+    Input variables as in pcs_ar.
+    """
+    run({'estimator': 'ar_order', 'pcs': pcs, 'ar_max': ar_max, 'ma_max': ma_max, 'winsize': winsize, \
+            'realizations': mc_round, 'slicing': slicing, 'snr': snr, 'noise_type': noise_type}, \
+            processes=1, resume=False)
 
+def pcs_search(pcs, ars, mas, winsize, mc_round, slicing, snr, noise_type, threshold=0.05, processes=None):
+    """
+    Select the (ar, ma) order of the AR data by order_search over its mc_round realizations.
+    Input variables as in pcs_ar; ars, mas, threshold and processes as in order_search.
+        Return: the return of order_search
+    """
+    cell = {'snr': snr, 'noise_type': noise_type}
+    signals = np.array([load("ar_data", cell, i, slicing) for i in range(mc_round)])
+    selected, pairs, orders, stats = order_search(signals, pcs, ars, mas, winsize, threshold, processes)
+    print "snr=%d, %s: (ar, ma) = %s, %d of %d tasks, %.1fs"%(snr, noise_type, selected, \
+            stats['tasks'], stats['grid'], stats['wall'])
+    return selected, pairs, orders, stats
@@ -0,0 +1,79 @@
+import numpy as np
+from cumest import cumest_segments
+from cumxst import cumx_segments
+from cum2x import pooled
+
+def ar_lags(p, q, norder):
+    """The (norder, k1, k2) slices used by the normal equations of arrcest."""
+    lags = []
+    if norder != 2:
+        lags += [(abs(norder), k1, 0) for k1 in range(q-p, q+1)]
+    if norder == 2 or norder < 0:
+        lags += [(2, 0, 0)]
+    return lags
+
+def normal_equations(cum, p, q, maxlag):
+    """
+    The AR normal equations of one cumulant slice.
+        cum - C(m), -maxlag <= m <= maxlag
+        Return: (amat, rvec), amat[i,j] = C(q-p+1+i+j) and rvec[i] = -C(q+1+i), 0 <= i < maxlag-q
+    """
+    index = q-p+1+maxlag + np.arange(maxlag-q)[:, np.newaxis] + np.arange(p)
+    return cum[index], -cum[q+1+maxlag:]
+
+def ar_solve(stats, p, q, maxlag):
+    """Least-squares AR parameter vector from [(sums, counts)] of ar_lags, see cum2x.pooled."""
+    amat, rvec = zip(*[normal_equations(pooled(sums, counts), p, q, maxlag) for sums, counts in stats])
+    avec = np.linalg.lstsq(np.vstack(amat), np.hstack(rvec), rcond=None)[0]
+    return np.hstack((1, avec[::-1]))
+
+def check(p, q, norder, maxlag):
+    """Validate the parameters of arrcest, return the maxlag actually used."""
+    assert q >= 0, "MA order q must be non-negative"
+    if norder not in (2, 3, 4, -3, -4):
+        raise Exception("norder must be 2, 3, 4, -3 or -4")
+    if maxlag < p+q:
+        if maxlag > 0:
+            print "ARRCEST: maxlag changed from %d to %d" % (maxlag, p+q)
+        maxlag = p+q
+    return maxlag
+
+def arrcest(y, p, q=0, norder=2, maxlag=0, samp_seg=0, overlap=0, flag='biased'):
+    """
+    ARRCEST AR parameter estimation via the normal equations of cumulants and/or correlation
+        y - time-series (vector)
+        p - AR order
+        q - MA order  [default = 0]
+        norder - 2: correlation, 3 or 4: cumulants of that order,
+                 -3 or -4: correlation together with cumulants  [default = 2]
+        maxlag - maximum lag to use  [default = p+q]
+        samp_seg - samples per segment  [default: length of y]
+        overlap - percentage overlap of segments  [default = 0]
+        flag - 'biased' or 'unbiased'  [default = 'biased']
+        Return: estimated AR parameter vector [1, a(1), ..., a(p)]
+    """
+    if p <= 0: return np.ones(1)
+    maxlag = check(p, q, norder, maxlag)
+    overlap = max(0, min(overlap,99))
+    return ar_solve(cumest_segments(y, ar_lags(p, q, norder), maxlag, samp_seg, overlap, flag), p, q, maxlag)
+
+def arrcestx(y, pcs, p, q=0, norder=3, maxlag=0, samp_seg=0, overlap=0):
+    """
+    ARRCEST with the PCS cumulant estimates, see arrcest and cumxst.cumx.
+        pcs - PCS coefficients, at least abs(norder) of them
+    """
+    if p <= 0: return np.ones(1)
+    maxlag = check(p, q, norder, maxlag)
+    overlap = max(0, min(overlap,99))
+    return ar_solve(cumx_segments(y, pcs, ar_lags(p, q, norder), maxlag, samp_seg, overlap), p, q, maxlag)
+
+def test():
+    import scipy.io as sio
+    # AR(2) with parameters [1 -1.5 0.8], exponential input, SNR 20 dB
+    y = sio.loadmat("matfile/demo/ar1.mat")['y']
+    for norder in (2, 3, 4, -3, -4):
+        print arrcest(y, 2, 0, norder, 12, 128)
+
+
+if __name__=="__main__":
+    test()
@@ -0,0 +1,135 @@
+"""
+Persistent, content-addressed cache of estimator calls.
+A call is identified by the hash of the estimator, the bytes of its array
+arguments and the repr of its other arguments, so the same estimation asked by
+another script, sweep or process is read back from disk instead of recomputed.
+The cache is off until a directory is given, by enable or by the environment
+variable HOPCS_CACHE; it holds at most about LIMIT bytes, the least recently used
+results being removed first. The size is tracked as results are stored, and the
+directory is only walked when it passes LIMIT, the eviction then making room
+for a tenth of LIMIT; results stored meanwhile by other processes are counted
+at the next walk.
+Only the arguments and the code of the memoized function itself enter the key:
+bump VERSION when an estimator changes its results through a function it calls.
+"""
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+# the code of the helpers of an estimator (e.g. hankel_spectrum or cum3x_slices under
+# ar_estimate) is not in the key: bump VERSION whenever such a helper changes its results
+VERSION = 1
+DIRECTORY = os.environ.get("HOPCS_CACHE")
+LIMIT = int(os.environ.get("HOPCS_CACHE_LIMIT", 2**30))
+# bytes in DIRECTORY at the last walk plus the results stored since, None until the first walk
+TOTAL = None
+
+def enable(directory, limit=None):
+    """Cache the memoized estimators in directory, holding at most limit bytes  [default: LIMIT]."""
+    global DIRECTORY, LIMIT, TOTAL
+    DIRECTORY = directory
+    TOTAL = None
+    if limit is not None:
+        LIMIT = limit
+
+def disable():
+    global DIRECTORY
+    DIRECTORY = None
+
+def update(h, value):
+    """Feed an argument to the hash h: arrays by their bytes, containers item by item."""
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update("array %s %s "%(value.dtype.str, value.shape))
+        h.update(value.view(np.uint8))
+    elif isinstance(value, (list, tuple)):
+        h.update("%s %d ("%(type(value).__name__, len(value)))
+        for k in value:
+            update(h, k)
+        h.update(") ")
+    elif isinstance(value, dict):
+        update(h, sorted(value.items()))
+    else:
+        h.update("%r "%(value,))
+
+def digest(name, code, args, kwargs):
+    """The key of a call: sha1 of the estimator, its code, and its arguments."""
+    h = hashlib.sha1("%s %d %s "%(name, VERSION, hashlib.sha1(code).hexdigest()))
+    update(h, list(args))
+    update(h, kwargs)
+    return h.hexdigest()
+
+def path(key):
+    return os.path.join(DIRECTORY, key[:2], key + ".npy")
+
+def lookup(key):
+    """The cached result of the key or None; a hit refreshes its time for the LRU order."""
+    filename = path(key)
+    try:
+        result = np.load(filename)
+        os.utime(filename, None)
+        return result
+    except (IOError, OSError, ValueError):
+        return None
+
+def store(key, result):
+    """Write the result atomically, then evict the least recently used results once above LIMIT."""
+    global TOTAL
+    filename = path(key)
+    if not os.path.isdir(os.path.dirname(filename)):
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError:
+            pass
+    fd, temp = tempfile.mkstemp(".part", key, os.path.dirname(filename))
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, result)
+    os.rename(temp, filename)
+    if TOTAL is not None:
+        TOTAL += os.path.getsize(filename)
+    if TOTAL is None or TOTAL > LIMIT:
+        evict()
+
+def evict():
+    """Remove the least recently used results until the cache holds at most 0.9 LIMIT bytes."""
+    global TOTAL
+    files = []
+    for root, dirs, names in os.walk(DIRECTORY):
+        for name in names:
+            if not name.endswith(".npy"): continue
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+    total = sum(k[1] for k in files)
+    for mtime, size, filename in sorted(files):
+        if total <= 0.9*LIMIT: break
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        total -= size
+    TOTAL = total
+
+def memoize(function):
+    """
+    Return function with its results cached on disk, see the module documentation.
+    Only array results are cached, other results are returned as they are.
+    """
+    name = "%s.%s"%(function.__module__, function.__name__)
+    code = function.__code__.co_code
+    def memoized(*args, **kwargs):
+        if DIRECTORY is None:
+            return function(*args, **kwargs)
+        key = digest(name, code, args, kwargs)
+        result = lookup(key)
+        if result is None:
+            result = function(*args, **kwargs)
+            if isinstance(result, np.ndarray) and result.dtype != object:
+                store(key, result)
+        return result
+    memoized.__name__ = function.__name__
+    memoized.__doc__ = function.__doc__
+    return memoized
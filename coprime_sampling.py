@@ -88,6 +88,60 @@ def estc3 (signal, pcs, cplst, delay, NFFT):
     #np.save("result/exp_deviate_estc2_full_%d.npy"%(round), np.array(estc2full))
     return result
 
+def coarray_index (cplst, lags, NFFT):
+    """
+    Return the positions realizing every lag tuple in the coprime coarray.
+    Input:  cplst: the list of pairwise coprime factors.
+            lags: list of lag tuples (t1, ..., tk).
+            NFFT: length of the segment. The sampling pattern repeats in every segment.
+    Return: list of index arrays, one per lag tuple. Each entry n satisfies that
+            n, n+t1, ..., n+tk are all sampled by some factor and lie within the segment.
+    """
+    mask = np.zeros(NFFT, dtype=bool)
+    for k in cplst:
+        mask[::k] = True
+
+    result = []
+    for lag in lags:
+        lag = np.atleast_1d(lag)
+        lo = max(0, -min(lag.min(), 0))
+        hi = NFFT - max(lag.max(), 0)
+        base = np.arange(lo, max(lo, hi))
+        valid = mask[base]
+        for l in lag:
+            valid &= mask[base+l]
+        result.append(base[valid])
+    return result
+
+def estcN (signal, cplst, lags, norder, NFFT):
+    """
+    Return estimated moments of arbitrary order over the coprime coarray.
+    Input:  signal: the original (unsampled) signal, 1-d vector.
+            cplst: the list of pairwise coprime factors.
+            lags: list of lag tuples, each with norder-1 entries.
+                  (t1,...,tk) estimates E x(n)x(n+t1)...x(n+tk).
+            norder: order of the statistic.
+            NFFT: length of the segment.
+    Return: (segments, len(lags)) matrix of running averages, the same layout as estc2.
+            estc2 corresponds to lags [(m,)] with norder=2 and estc3 to [(0,m)] with norder=3.
+    """
+    lags = [tuple(np.atleast_1d(k)) for k in lags]
+    assert all(len(k) == norder-1 for k in lags), "Every lag tuple should have norder-1 entries."
+    maxstep = len(signal)/NFFT
+    frames = np.reshape(signal[:maxstep*NFFT], (maxstep, NFFT))
+    index = coarray_index(cplst, lags, NFFT)
+
+    total = np.zeros((maxstep, len(lags)))
+    for j in range(len(lags)):
+        base = index[j]
+        prod = frames[:, base]
+        for l in lags[j]:
+            prod = prod*frames[:, base+l]
+        total[:, j] = np.sum(prod, 1)
+    # every segment holds the same positions of the coarray, zero samples included
+    count = np.arange(1, maxstep+1)[:, np.newaxis]*np.array([len(k) for k in index])
+    return np.cumsum(total, 0)/np.maximum(count, 1)
+
 def test_coprime (input):
     if len(input)<=1: return False
     for i in range(len(input)):
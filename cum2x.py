@@ -1,42 +1,87 @@
 import numpy as np
 
+def segments (x, nsamp, overlap):
+    """
+    Return the (nrecs, nsamp) matrix holding one segment of x per row.
+    The segmentation is the same as the one in the cumulant estimators.
+    """
+    overlap = overlap/100*nsamp
+    nadvance = nsamp - overlap
+    nrecs  = (len(x)-overlap)/nadvance
+    index = np.arange(nrecs)[:, np.newaxis]*nadvance + np.arange(nsamp)
+    return np.asarray(x, dtype=float).flatten()[index]
+
+def centering (xs):
+    """Remove the mean of the non-zero samples in every row, keeping the zeros."""
+    nonzero = xs != 0
+    mean = np.sum(xs, 1)/np.sum(nonzero, 1)
+    return np.where(nonzero, xs-mean[:, np.newaxis], 0)
+
+def pooled (sums, counts):
+    """
+    Combine per-segment contributions into the final estimate.
+        sums, counts - (nrecs, nrot, nlags) contributions of every segment
+                       and every rotation of the sampled streams
+    Return: sum(sums)/sum(counts) over the segments, averaged over the rotations.
+    """
+    return np.mean(np.sum(sums, 0)/np.sum(counts, 0), 0)
+
+def cum2x_segments (xs, ys, maxlag):
+    """
+    Per-segment lag products of the (centered) segments xs and ys.
+    Return: (sums, counts), both (nrecs, 2*maxlag+1); counts are the non-zero products.
+    """
+    nrecs, nsamp = xs.shape
+    sums = np.zeros((nrecs, 2*maxlag+1))
+    counts = np.zeros((nrecs, 2*maxlag+1))
+    for m in range(-maxlag, maxlag+1):
+        if m >= 0:
+            temp = xs[:, :nsamp-m]*ys[:, m:]
+        else:
+            temp = xs[:, -m:]*ys[:, :nsamp+m]
+        sums[:, maxlag+m] = np.sum(temp, 1)
+        counts[:, maxlag+m] = np.sum(temp != 0, 1)
+    return sums, counts
+
 def cum2x (x,y, maxlag, nsamp, overlap):
     assert len(x) == len(y), "The two signal should be same length!"
     assert maxlag >= 0, " 'maxlag' must be non-negative!"
     if nsamp > len(x) or nsamp <= 0:
         nsamp = len(x)
+    sums, counts = cum2x_segments(centering(segments(x, nsamp, overlap)), \
+            centering(segments(y, nsamp, overlap)), maxlag)
+    return np.sum(sums, 0)/np.sum(counts, 0)
+
+def prefix_records (lengths, nsamp, overlap):
+    """The number of segments of every prefix y[:length], the same segmentation as segments."""
     overlap = overlap/100*nsamp
     nadvance = nsamp - overlap
-    nrecs  = (len(x)-overlap)/nadvance
-    nlags = 2*maxlag+1
-    y_cum = np.zeros(nlags, dtype=float)
-    count = np.zeros(nlags, dtype=float)
-
-    ind = 0
-    for k in range(nrecs):
-        xs = x[ind:(ind+nsamp)]
-        xs = np.array([j-float(sum(xs))/sum(1 for i in xs if i!=0) if j!=0 else 0 for j in xs])
-        ys = y[ind:(ind+nsamp)]
-        ys = np.array([j-float(sum(ys))/sum(1 for i in ys if i!=0) if j!=0 else 0 for j in ys])
-        temp = xs*ys
-        y_cum[maxlag] += reduce(lambda m,n:m+n,temp, 0)
-        count[maxlag] += sum(1 for i in temp if i!=0)
-        for m in range(1,maxlag+1):
-            temp = xs[m:nsamp]*ys[:nsamp-m]
-            y_cum[maxlag-m] = y_cum[maxlag-m]+reduce(lambda i,j:i+j,temp, 0)
-            count[maxlag-m] += sum(1 for i in temp if i!=0)
-            temp = xs[:nsamp-m]*ys[m:nsamp]
-            y_cum[maxlag+m] = y_cum[maxlag+m]+reduce(lambda i,j:i+j,temp, 0)
-            count[maxlag+m] += sum(1 for i in temp if i!=0)
-        ind += nadvance
-#    if flag == "biased":
-#        scale = np.ones(nlags, dtype=float)/nsamp/nrecs
-#    elif flag == "unbiased":
-#        scale = np.array(range(nsamp-maxlag,nsamp+1)+range(nsamp-1,nsamp-maxlag-1,-1))
-#        scale = np.ones(2*maxlag+1, dtype=float)/scale
-#    else:
-#        raise Exception("The flag should be either 'biased' or 'unbiased'!!")
-    scale = 1./count
-    return y_cum*scale
+    return [(length-overlap)/nadvance for length in lengths]
 
+def prefix_pooled (sums, counts, nrecs):
+    """
+    pooled over the first n segments, for every n in nrecs, from one pass of cumulative sums.
+        sums, counts - (nrecs, nrot, nlags) contributions of every segment, see pooled
+        Return: (len(nrecs), nlags) estimates
+    """
+    assert min(nrecs) > 0, "Every prefix should hold at least one segment!"
+    index = np.asarray(nrecs) - 1
+    return np.mean(np.cumsum(sums, 0)[index]/np.cumsum(counts, 0)[index], 1)
 
+def noise_polynomial (estimate, degree, scales):
+    """
+    Evaluate estimate(a) for every noise scale a in scales, where estimate(a) is a
+    polynomial in a of the given degree, e.g. a sample cumulant of signal+a*noise
+    with the same signal and unit noise for every a.
+    The coefficient tables are fitted once from degree+1 estimates at Chebyshev
+    nodes on [0, max(scales)], every scale is then a polynomial evaluation.
+        Return: (len(scales), ...) array, row k equals estimate(scales[k])
+    """
+    scales = np.asarray(scales, dtype=float)
+    top = np.max(np.abs(scales))
+    if top == 0:
+        return np.array([estimate(0.)]*len(scales))
+    nodes = (1-np.cos(np.pi*np.arange(degree+1)/degree))/2
+    values = np.array([estimate(top*u) for u in nodes])
+    coefs = np.linalg.solve(np.vander(nodes, increasing=True), values.reshape(degree+1, -1))
+    return np.dot(np.vander(scales/top, degree+1, increasing=True), coefs).reshape((len(scales),)+values.shape[1:])
@@ -1,5 +1,28 @@
 import numpy as np
-from cum2x import cum2x
+from cum2x import cum2x, segments, prefix_records, prefix_pooled, noise_polynomial
+
+def centered_segments (signal, nsamp, overlap=0):
+    """Return the segments of signal, one per row, each with its mean removed."""
+    x = segments(signal, nsamp, overlap)
+    return x - np.mean(x, 1)[:, np.newaxis]
+
+def cum2est_segments (x, maxlag, flag="unbiased"):
+    """
+    Per-segment contributions of cum2est.
+        x: (nrecord, nsamp) mean-removed segments
+    Return: (nrecord, 2*maxlag+1); cum2est is their mean.
+    """
+    nrecord, nsamp = x.shape
+    y_cum = np.zeros((nrecord, maxlag+1), dtype=float)
+    for k in range(maxlag+1):
+        y_cum[:, k] = np.sum(x[:, :nsamp-k]*x[:, k:], 1)
+    if flag == "biased":
+        y_cum = y_cum / nsamp
+    elif flag == "unbiased":
+        y_cum = y_cum / (nsamp-np.arange(maxlag+1))
+    else:
+        raise Exception("The flag should be either 'biased' or 'unbiased'!!")
+    return np.hstack((y_cum[:, :0:-1], y_cum))
 
 def cum2est (signal, maxlag, nsamp, overlap=0, flag="unbiased"):
     """
@@ -13,30 +36,45 @@ def cum2est (signal, maxlag, nsamp, overlap=0, flag="unbiased"):
          y_cum: estimated covariance,
                 C2(m)  -maxlag <= m <= maxlag
     """
-    overlap = overlap/100*nsamp
-    nadvance = nsamp - overlap
-    nrecord = (len(signal)-overlap)/(nsamp-overlap)
+    return np.mean(cum2est_segments(centered_segments(signal, nsamp, overlap), maxlag, flag), 0)
+
+def lag_product (x, k1):
+    """Return z(n) = x(n)x(n+k1) for every segment, zero where n+k1 is out of the segment."""
+    nsamp = x.shape[1]
+    z = np.zeros(x.shape)
+    if k1 >= 0:
+        z[:, :nsamp-k1] = x[:, :nsamp-k1]*x[:, k1:]
+    else:
+        z[:, -k1:] = x[:, -k1:]*x[:, :nsamp+k1]
+    return z
 
-    y_cum = np.zeros(maxlag+1, dtype=float)
-    ind = 0
+def cross_lags (z, x, maxlag):
+    """Return sum_n z(n)x(n+m) of every segment, -maxlag <= m <= maxlag."""
+    nsamp = x.shape[1]
+    y_cum = np.zeros((len(x), 2*maxlag+1), dtype=float)
+    y_cum[:, maxlag] = np.sum(z*x, 1)
+    for k in range(1, maxlag+1):
+        y_cum[:, maxlag-k] = np.sum(z[:, k:]*x[:, :nsamp-k], 1)
+        y_cum[:, maxlag+k] = np.sum(z[:, :nsamp-k]*x[:, k:], 1)
+    return y_cum
 
-    for i in range(nrecord):
-        # cummulant = signal - expectation
-        x = signal[ind:(ind+nsamp)]
-        x = x-float(sum(x))/len(x)
-        for k in range(maxlag+1):
-            y_cum[k] = y_cum[k] + reduce(lambda m,n:m+n, x[:(nsamp-k)]*x[k:nsamp], 0)
-        ind += nadvance
+def cum3est_segments (x, maxlag, flag="unbiased", k1=0):
+    """
+    Per-segment contributions of cum3est.
+        x: (nrecord, nsamp) mean-removed segments
+    Return: (nrecord, 2*maxlag+1); cum3est is their mean.
+    """
+    nsamp = x.shape[1]
+    nlags = 2*maxlag + 1
     if flag == "biased":
-        y_cum = y_cum / (nsamp*nrecord)
+        scale = np.ones(nlags, dtype=float)/nsamp
     elif flag == "unbiased":
-        y_cum = y_cum / (nrecord * (nsamp-np.array(range(maxlag+1))))
+        lsamp = nsamp - abs(k1)
+        scale = np.array(range(lsamp-maxlag,lsamp+1) + range(lsamp-1, lsamp-maxlag-1, -1))
+        scale = np.ones(len(scale), dtype=float)/scale
     else:
         raise Exception("The flag should be either 'biased' or 'unbiased'!!")
-    if maxlag>0:
-        y_cum = np.hstack((np.conjugate(y_cum[maxlag+1:0:-1]), y_cum))
-    return y_cum
-
+    return cross_lags(lag_product(x, k1), x, maxlag)*scale
 
 def cum3est (signal, maxlag, nsamp, overlap=0, flag="unbiased", k1=0):
     """
@@ -51,42 +89,45 @@ def cum3est (signal, maxlag, nsamp, overlap=0, flag="unbiased", k1=0):
         y_cum:  estimated third-order cumulant,
                  C3(m,k1)  -maxlag <= m <= maxlag
     """
-    minlag = -maxlag
-    overlap = overlap/100*nsamp
-    nadvance = nsamp - overlap
-    nrecord = (len(signal)-overlap)/(nsamp-overlap)
-
-    y_cum = np.zeros(maxlag*2+1, dtype=float)
-    ind = 0
-    nlags = 2*maxlag + 1
+    return np.mean(cum3est_segments(centered_segments(signal, nsamp, overlap), maxlag, flag, k1), 0)
 
+def cum4est_segments (x, maxlag, flag="unbiased", k1=0, k2=0):
+    """
+    Per-segment contributions of cum4est.
+        x: (nrecord, nsamp) mean-removed segments
+    Return: (nrecord, 2*maxlag+1); cum4est is their mean.
+    """
+    nsamp = x.shape[1]
+    nlags = 2 * maxlag +1
     if flag == "biased":
         scale = np.ones(nlags, dtype=float)/nsamp
     elif flag == "unbiased":
-        lsamp = nsamp - abs(k1)
-        scale = np.array(range(lsamp-maxlag,lsamp+1) + range(lsamp-1, lsamp-maxlag-1, -1))
+        ind = np.array(range(-maxlag,maxlag+1))
+        kmin = min(0, min(k1, k2))
+        kmax = max(0, max(k1, k2))
+        scale = nsamp - np.array([max(k, kmax) for k in ind]) + np.array([min(k, kmin) for k in ind])
         scale = np.ones(len(scale), dtype=float)/scale
     else:
         raise Exception("The flag should be either 'biased' or 'unbiased'!!")
 
-    for i in range(nrecord):
-        x = signal[ind:(ind+nsamp)]
-        x = x-float(sum(x))/len(x)
-        cx = np.conjugate(x)
-        z = x*0
-        if k1 >= 0:
-            z[:nsamp-k1] = x[:nsamp-k1]*cx[k1:nsamp]
-        else:
-            z[-k1:nsamp] = x[-k1:nsamp]*cx[:nsamp+k1]
-
-        y_cum[maxlag] = y_cum[maxlag] +  reduce(lambda m,n:m+n, z*x, 0)
+    mlag = maxlag + max(abs(np.array([k1, k2])))
+    mlag = max (mlag, abs(k1-k2))
+    nlag = maxlag
 
-        for k in range(1, maxlag+1):
-            y_cum[maxlag-k] = y_cum[maxlag-k] + reduce(lambda m,n:m+n, z[k:nsamp]*x[:nsamp-k], 0)
-            y_cum[maxlag+k] = y_cum[maxlag+k] + reduce(lambda m,n:m+n, z[:nsamp-k]*x[k:nsamp], 0)
-        ind += nadvance
+    z = lag_product(x, k1)
+    if k2 >= 0:
+        z[:, :nsamp-k2] = z[:, :nsamp-k2] * x[:, k2:]
+        z[:, nsamp-k2:] = 0
+    else:
+        z[:, -k2:] = z[:, -k2:] * x[:, :nsamp+k2]
+        z[:, :-k2] = 0
 
-    return y_cum*scale/nrecord
+    y_cum = cross_lags(z, x, maxlag)*scale
+    # real signal: M_yy = R_yy
+    R_yy = cum2est_segments(x, mlag, flag)
+    return y_cum - R_yy[:, mlag+k1:mlag+k1+1]*R_yy[:, mlag-k2-nlag:mlag-k2+nlag+1] \
+            - R_yy[:, k1-k2+mlag:k1-k2+mlag+1]*R_yy[:, mlag-nlag:mlag+nlag+1] \
+            - R_yy[:, mlag+k2:mlag+k2+1]*R_yy[:, mlag-k1-nlag:mlag-k1+nlag+1]
 
 def cum4est (signal, maxlag, nsamp, overlap=0, flag="unbiased", k1=0, k2=0):
     """
@@ -105,77 +146,7 @@ def cum4est (signal, maxlag, nsamp, overlap=0, flag="unbiased", k1=0, k2=0):
           y_cum : estimated fourth-order cumulant slice
                  C4(m,k1,k2)  -maxlag <= m <= maxlag
     """
-    minlag = -maxlag
-    overlap = overlap/100*nsamp
-    nadvance = nsamp - overlap
-    nrecord = (len(signal)-overlap)/(nsamp-overlap)
-
-    nlags = 2 * maxlag +1
-    tmp = np.zeros(nlags, dtype=float)
-    if flag == "biased":
-        scale = np.ones(nlags, dtype=float)/nsamp
-    elif flag == "unbiased":
-        ind = np.array(range(-maxlag,maxlag+1))
-        kmin = min(0, min(k1, k2))
-        kmax = max(0, max(k1, k2))
-        scale = nsamp - np.array([max(k, kmax) for k in ind]) + np.array([min(k, kmin) for k in ind])
-        scale = np.ones(len(scale), dtype=float)/scale
-    else:
-        raise Exception("The flag should be either 'biased' or 'unbiased'!!")
-
-    mlag = maxlag + max(abs(np.array([k1, k2])))
-    mlag = max (mlag, abs(k1-k2))
-    nlag = maxlag
-    m2k2 = np.zeros(2*maxlag+1, dtype=float)
-
-    if any(signal.imag) != 0:
-        complex_flag = 1
-    else:
-        complex_flag = 0
-
-    y_cum = np.zeros(2*maxlag+1, dtype=float)
-    R_yy = np.zeros(2*mlag+1, dtype=float)
-
-    ind = 0
-    for i in range(nrecord):
-        tmp = y_cum * 0
-        x = signal[ind:(ind+nsamp)]
-        x = x-float(sum(x))/len(x)
-        cx = np.conjugate(x)
-        z = x*0
-
-        if k1 >= 0:
-            z[:nsamp-k1] = x[:nsamp-k1]*cx[k1:nsamp]
-        else:
-            z[-k1:nsamp] = x[-k1:nsamp]*cx[:nsamp+k1]
-        if k2 >= 0:
-            z[:nsamp-k2] = z[:nsamp-k2] * x[k2:nsamp]
-            if len(z.shape) == 1:
-                z[nsamp-k2:nsamp] = np.zeros(k2)
-            else:
-                z[nsamp-k2:nsamp] = np.zeros((k2, z.shape[1]))
-        else:
-            z[-k2:nsamp] = z[-k2:nsamp] * x[:nsamp+k2]
-            z[:-k2] = np.zeros[-k2]
-        
-        tmp[maxlag] = tmp[maxlag] + reduce(lambda m,n:m+n, z*x, 0)
-        for k in range(1, maxlag+1):
-            tmp[maxlag-k] = tmp[maxlag-k] + reduce(lambda m,n:m+n, z[k:nsamp]*x[:nsamp-k], 0)
-            tmp[maxlag+k] = tmp[maxlag+k] + reduce(lambda m,n:m+n, z[:nsamp-k]*x[k:nsamp], 0)
-        
-        y_cum = y_cum + tmp*scale
-        R_yy = cum2est(x,mlag,nsamp,overlap,flag)
-        if complex_flag:
-            M_yy = cum2x(np.conjugate(x), x, mlag, nsamp, overlap, flag)
-        else:
-            M_yy = R_yy
-
-        y_cum = y_cum - R_yy[mlag+k1]*R_yy[mlag-k2-nlag:mlag-k2+nlag+1] \
-                - R_yy[k1-k2+mlag]*R_yy[mlag-nlag:mlag+nlag+1] \
-                - M_yy[mlag+k2]*M_yy[mlag-k1-nlag:mlag-k1+nlag+1]
-        ind += nadvance
-
-    return y_cum/nrecord
+    return np.mean(cum4est_segments(centered_segments(signal, nsamp, overlap), maxlag, flag, k1, k2), 0)
 
 def test ():
     import scipy.io as sio
@@ -228,6 +199,62 @@ def cumest (y,norder=2,maxlag=0,nsamp=0,overlap=0,flag='biased',k1=0,k2=0):
     else:
         raise Exception("Cumulant order must be 2, 3, or 4!")
 
+def cumest_segments (y,lags,maxlag=0,nsamp=0,overlap=0,flag='biased'):
+    """
+    Per-segment contributions of several cumulant slices, from one segmentation of y.
+         lags - list of (norder, k1, k2), one entry per slice
+         maxlag, nsamp, overlap, flag - as in cumest
+         Return: list of (sums, counts), each (nrecord, 1, 2*maxlag+1),
+                 such that cum2x.pooled(sums, counts) equals the cumest slice.
+    """
+    assert maxlag>0, "maxlag must be non-negative!"
+    assert nsamp>=0 and nsamp<len(y), "The number of samples is illigal!"
+    if nsamp == 0: nsamp = len(y)
+    x = centered_segments(y, nsamp, overlap)
+
+    result = []
+    for norder, k1, k2 in lags:
+        if norder == 2:
+            temp = cum2est_segments(x, maxlag, flag)
+        elif norder == 3:
+            temp = cum3est_segments(x, maxlag, flag, k1)
+        elif norder == 4:
+            temp = cum4est_segments(x, maxlag, flag, k1, k2)
+        else:
+            raise Exception("Cumulant order must be 2, 3, or 4!")
+        temp = temp[:, np.newaxis, :]
+        result.append((temp, np.ones(temp.shape)))
+    return result
+
+def cumest_prefix (y,lengths,norder=2,maxlag=0,nsamp=0,overlap=0,flag='biased',k1=0,k2=0):
+    """
+    cumest of several prefixes of y, from one pass over the segments.
+         lengths - prefix lengths, each holding at least one segment
+         nsamp - samples per segment, should be given
+         other parameters as in cumest
+         Return: (len(lengths), 2*maxlag+1) array, row k equals cumest(y[:lengths[k]], ...)
+    """
+    assert nsamp > 0, "The number of samples per segment should be given!"
+    sums, counts = cumest_segments(y[:max(lengths)], [(norder, k1, k2)], maxlag, nsamp, overlap, flag)[0]
+    return prefix_pooled(sums, counts, prefix_records(lengths, nsamp, overlap))
+
+def cumest_snr (y,noise,scales,norder=2,maxlag=0,nsamp=0,overlap=0,flag='biased',k1=0,k2=0):
+    """
+    cumest of y+a*noise for every noise scale a, e.g. every SNR of a sweep.
+    The estimate is a polynomial of degree norder in a, its coefficient tables
+    are computed once from norder+1 estimates, see cum2x.noise_polynomial.
+         noise - unit noise record, the same length as y
+         scales - the noise scales a; for white noise at snr dB the drivers use
+                  a = sqrt(sum(sig_tap)**2/10**(snr/10.))
+         other parameters as in cumest
+         Return: (len(scales), 2*maxlag+1) array, row k equals cumest(y+scales[k]*noise, ...)
+    """
+    assert len(y) == len(noise), "The signal and the noise should be same length!"
+    y = np.asarray(y, dtype=float).flatten()
+    noise = np.asarray(noise, dtype=float).flatten()
+    return noise_polynomial(lambda a: cumest(y+a*noise, norder, maxlag, nsamp, overlap, flag, k1, k2), \
+            norder, scales)
+
 if __name__=="__main__":
     test()
 
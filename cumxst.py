@@ -1,6 +1,7 @@
 import numpy as np
 from cumest import cum2est, cum3est, cum4est
-from cum2x import cum2x
+from cum2x import cum2x, cum2x_segments, segments, centering, pooled, prefix_records, prefix_pooled, \
+        noise_polynomial
 
 def sampling (signal, winsize, factor):
     """
@@ -9,9 +10,47 @@ def sampling (signal, winsize, factor):
     The downsampling is performed **within** every winsize
     NOTE: it is different from the same function in "sampling.py".
     """
-    return np.array([signal[k] if (k%winsize)%factor==0 else 0 for k in range(len(signal))])
+    return np.where((np.arange(len(signal))%winsize)%factor==0, signal, 0)
 
 
+def lagged (xs, maxlag):
+    """Return (nrecs, 2*maxlag+1, nsamp) holding x(n+m) at [:, maxlag+m, n], zero out of the segment."""
+    nrecs, nsamp = xs.shape
+    padded = np.hstack((np.zeros((nrecs, maxlag)), xs, np.zeros((nrecs, maxlag))))
+    return padded[:, np.arange(2*maxlag+1)[:, np.newaxis] + np.arange(nsamp)]
+
+def cum3x_slices_segments (xs, ys, zs, maxlag, k1s, chunk=2**22):
+    """
+    Per-segment lag products of several slices of cum3x_pcs, from one pass over the segments.
+        xs, ys, zs - (nrecs, nsamp) segments of the sampled streams
+        k1s - the fixed lags k1 of the slices
+        chunk - bound on the number of lagged samples held at once
+    Return: (sums, counts), both (nrecs, len(k1s), 2*maxlag+1); counts are the non-zero products.
+    """
+    nrecs, nsamp = xs.shape
+    k1s = np.asarray(k1s)
+    maxk = np.max(np.abs(k1s))
+    sums = np.zeros((nrecs, len(k1s), 2*maxlag+1))
+    counts = np.zeros((nrecs, len(k1s), 2*maxlag+1))
+    step = max(1, chunk/((2*maxlag+1+len(k1s))*nsamp))
+    for start in range(0, nrecs, step):
+        rows = slice(start, start+step)
+        # u[k, n] = x(n)z(n+k1s[k]) and y(n+m), both zero out of the segment
+        u = xs[rows, np.newaxis, :]*lagged(zs[rows], maxk)[:, maxk+k1s, :]
+        ylag = np.transpose(lagged(ys[rows], maxlag), (0, 2, 1))
+        sums[rows] = np.matmul(u, ylag)
+        counts[rows] = np.matmul((u != 0).astype(float), (ylag != 0).astype(float))
+    return sums, counts
+
+def cum3x_segments (xs, ys, zs, maxlag, k1=0):
+    """
+    Per-segment lag products of cum3x_pcs.
+        xs, ys, zs - (nrecs, nsamp) segments of the sampled streams
+    Return: (sums, counts), both (nrecs, 2*maxlag+1); counts are the non-zero products.
+    """
+    sums, counts = cum3x_slices_segments(xs, ys, zs, maxlag, [k1])
+    return sums[:, 0], counts[:, 0]
+
 def cum3x_pcs (x, y, z, maxlag=0, nsamp=1, overlap=0, k1=0):
     """
     CUM3X Third-order cross-cumulants.
@@ -32,52 +71,69 @@ def cum3x_pcs (x, y, z, maxlag=0, nsamp=1, overlap=0, k1=0):
     """
     assert len(x) == len(y) == len(z), "the length of signal should be the same!"
     assert 0<=nsamp<=len(x), "The length of segment is illegal."
-    overlap = overlap/100*nsamp
-    nadvance = nsamp - overlap
-    nrecs  = (len(x)-overlap)/nadvance
+    # in current settings, the input pcs has already been zero-mean, and is real signal
+    sums, counts = cum3x_segments(segments(x, nsamp, overlap), segments(y, nsamp, overlap), \
+            segments(z, nsamp, overlap), maxlag, k1)
+    return np.sum(sums, 0)/np.sum(counts, 0)
+
+def cum4x_segments (ws, xs, ys, zs, maxlag, k1=0, k2=0):
+    """
+    Per-segment estimates of cum4x_pcs.
+        ws, xs, ys, zs - (nrecs, nsamp) segments of the sampled streams
+    Return: (nrecs, 2*maxlag+1); cum4x_pcs is their mean.
+    """
+    nrecs, nsamp = xs.shape
     nlags = 2*maxlag+1
-    y_cum = np.zeros(nlags, dtype=float)
-    count = np.zeros(nlags, dtype=float)
 
+    ziv = np.zeros(xs.shape)
     if k1 >= 0:
-        indx = range(nsamp-k1)
-        indz = range(k1, nsamp)
+        temp = ws[:, :nsamp-k1]*ys[:, k1:]
+        ziv[:, :nsamp-k1] = temp
     else:
-        indx = range(-k1, nsamp)
-        indz = range(nsamp+k1)
-    ind = 0
-    # in current settings, the input pcs has already been zero-mean, and is real signal
-    for k in range(nrecs):
-        xs = x[ind:(ind+nsamp)]
-        #xs = np.array([j-float(sum(xs))/sum(1 for i in xs if i!=0) if j!=0 else 0 for j in xs])
-        ys = y[ind:(ind+nsamp)]
-        #ys = np.array([j-float(sum(ys))/sum(1 for i in ys if i!=0) if j!=0 else 0 for j in ys])
-        zs = z[ind:(ind+nsamp)]
-        #zs = np.conjugate(np.array([j-float(sum(zs))/sum(1 for i in zs if i!=0) if j!=0 else 0 for j in zs]))
-
-        u = np.zeros(nsamp, dtype=float)
-        u[indx[0]:indx[-1]+1] = xs[indx]*zs[indz]
-
-        temp = u*ys
-        y_cum[maxlag] += reduce(lambda m,n:m+n,temp, 0)
-        count[maxlag] += sum(1 for i in temp if i!=0)
-        for m in range(1,maxlag+1):
-            temp = u[m:nsamp]*ys[:nsamp-m]
-            y_cum[maxlag-m] = y_cum[maxlag-m]+reduce(lambda i,j:i+j,temp, 0)
-            count[maxlag-m] += sum(1 for i in temp if i!=0)
-            temp = u[:nsamp-m]*ys[m:nsamp]
-            y_cum[maxlag+m] = y_cum[maxlag+m]+reduce(lambda i,j:i+j,temp, 0)
-            count[maxlag+m] += sum(1 for i in temp if i!=0)
-        ind += nadvance
-#    if flag == "biased":
-#        scale = np.ones(nlags, dtype=float)/nsamp/nrecs
-#    elif flag == "unbiased":
-#        lsamp = nsamp-abs(k1)
-#        scale = np.array(range(lsamp-maxlag,lsamp+1)+range(lsamp-1,lsamp-maxlag-1,-1))
-#        scale = np.ones(len(scale), dtype=float)/scale/nrecs
-#    else:
-#        raise Exception("The flag should be either 'biased' or 'unbiased'!!")
-    return y_cum/count
+        temp = ws[:, -k1:]*ys[:, :nsamp+k1]
+        ziv[:, -k1:] = temp
+    R_wy = np.sum(temp, 1)
+    sc1 = np.sum(temp != 0, 1)
+    if k2 >= 0:
+        ziv[:, :nsamp-k2] = ziv[:, :nsamp-k2] * zs[:, k2:]
+        ziv[:, nsamp-k2:] = 0
+        temp = ws[:, :nsamp-k2]*zs[:, k2:]
+    else:
+        ziv[:, -k2:] = ziv[:, -k2:] * zs[:, :nsamp+k2]
+        ziv[:, :-k2] = 0
+        temp = ws[:, -k2:]*zs[:, :nsamp+k2]
+    M_wz = np.sum(temp, 1)
+    sc2 = np.sum(temp != 0, 1)
+    if k1-k2 >= 0:
+        temp = zs[:, :nsamp-k1+k2]*ys[:, k1-k2:]
+    else:
+        temp = zs[:, -k1+k2:]*ys[:, :nsamp-k2+k1]
+    R_zy = np.sum(temp, 1)
+    sc12 = np.sum(temp != 0, 1)
+
+    # only consider the non-zero elements within every segment
+    tmp = np.zeros((nrecs, nlags))
+    count = np.zeros((nrecs, nlags))
+    for m in range(-maxlag, maxlag+1):
+        if m >= 0:
+            temp = ziv[:, :nsamp-m]*xs[:, m:]
+        else:
+            temp = ziv[:, -m:]*xs[:, :nsamp+m]
+        tmp[:, maxlag+m] = np.sum(temp, 1)
+        count[:, maxlag+m] = np.sum(temp != 0, 1)
+    y_cum = np.where(count != 0, tmp/np.maximum(count, 1), 0)
+
+    cws = centering(ws)
+    cxs = centering(xs)
+    sums, counts = cum2x_segments(cws, cxs, maxlag)
+    R_wx = sums/counts
+    sums, counts = cum2x_segments(centering(zs), cxs, maxlag+abs(k2))
+    R_zx = (sums/counts)[:, -k2+abs(k2):2*maxlag-k2+abs(k2)+1]
+    sums, counts = cum2x_segments(centering(ys), cxs, maxlag+abs(k1))
+    M_yx = (sums/counts)[:, -k1+abs(k1):2*maxlag-k1+abs(k1)+1]
+
+    return y_cum - (R_zy/sc12)[:, np.newaxis]*R_wx - (R_wy/sc1)[:, np.newaxis]*R_zx \
+            - (M_wz/sc2)[:, np.newaxis]*M_yx
 
 # in this algo. (w, y, z) have the same priority, rotating them will not
 # affact the final results. In contrast, x has higher priority.
@@ -102,82 +158,8 @@ def cum4x_pcs (w, x, y, z, maxlag=0, nsamp=1, overlap=0, k1=0, k2=0):
     assert length==len(y)==len(z)==len(w), "The four input signals should have same length!"
     assert maxlag>=0, "maxlag should be nonnegative!"
     assert 0<nsamp<=length, "The segmentation setting is illegal!"
-
-    overlap0 = overlap
-    overlap = overlap/100*nsamp
-    nadvance = nsamp - overlap
-    nrecs = (length-overlap)/nadvance
-    nlags = 2 * maxlag +1
-
-    y_cum = np.zeros(nlags, dtype=float)
-    rind = -np.array(range(-maxlag, maxlag+1))
-    ind = 0
-    for i in range(nrecs):
-        count = np.zeros(nlags, dtype=float)
-        tmp = y_cum * 0
-        R_zy = R_wy = M_wz = 0
-
-        ws = w[ind:(ind+nsamp)]
-        xs = x[ind:(ind+nsamp)]
-        zs = z[ind:(ind+nsamp)]
-        cys = ys = y[ind:(ind+nsamp)]
-        ziv = xs*0
-
-        if k1 >= 0:
-            ziv[:nsamp-k1] = ws[:nsamp-k1]*cys[k1:nsamp]
-            temp = ws[:nsamp-k1]*ys[k1:nsamp]
-            R_wy += sum(temp)
-            sc1 = sum(1 for m in temp if m!=0)
-        else:
-            ziv[-k1:nsamp] = ws[-k1:nsamp]*cys[:nsamp+k1]
-            temp = ws[-k1:nsamp]*ys[:nsamp+k1]
-            R_wy += sum(temp)
-            sc1 = sum(1 for m in temp if m!=0)
-        if k2 >= 0:
-            ziv[:nsamp-k2] = ziv[:nsamp-k2] * zs[k2:nsamp]
-            if len(z.shape) == 1:
-                ziv[nsamp-k2:nsamp] = np.zeros(k2)
-            else:
-                ziv[nsamp-k2:nsamp] = np.zeros((k2, z.shape[1]))
-            temp = ws[:nsamp-k2]*zs[k2:nsamp]
-            M_wz += sum(temp)
-            sc2 = sum(1 for m in temp if m!=0)
-        else:
-            ziv[-k2:nsamp] = ziv[-k2:nsamp] * zs[:nsamp+k2]
-            ziv[:-k2] = np.zeros[-k2]
-            temp = ws[-k2:nsamp]*zs[:nsamp-k2]
-            M_wz += sum(temp)
-            sc2 = sum(1 for m in temp if m!=0)
-        if k1-k2 >= 0:
-            temp = zs[:nsamp-k1+k2]*ys[k1-k2:nsamp]
-            R_zy += sum(temp)
-            sc12 = sum(1 for m in temp if m!=0)
-        else:
-            temp = zs[-k1+k2:nsamp]*ys[:nsamp-k2+k1]
-            R_zy += sum(temp)
-            sc12 = sum(1 for m in temp if m!=0)
-        
-        temp = ziv*xs
-        tmp[maxlag] += sum(temp)
-        count[maxlag] += sum(1 for m in temp if m!=0)
-        for k in range(1, maxlag+1):
-            temp = ziv[k:nsamp]*xs[:nsamp-k]
-            tmp[maxlag-k] += sum(temp)
-            count[maxlag-k] += sum(1 for m in temp if m!=0)
-            temp = ziv[:nsamp-k]*xs[k:nsamp]
-            tmp[maxlag+k] += sum(temp)
-            count[maxlag+k] += sum(1 for m in temp if m!=0)
-        
-        y_cum += [tmp[m]/count[m] if count[m]!=0 else 0 for m in range(len(count))]
-        R_wx = cum2x(ws, xs, maxlag, nsamp, overlap0)
-        R_zx = cum2x(zs, xs, maxlag+abs(k2), nsamp, overlap0)
-        M_yx = cum2x(cys, xs, maxlag+abs(k1), nsamp, overlap0)
-
-        y_cum = y_cum - R_zy*R_wx/sc12 - R_wy*R_zx[-k2+abs(k2):2*maxlag-k2+abs(k2)+1] /sc1 \
-                - M_wz*M_yx[-k1+abs(k1):2*maxlag-k1+abs(k1)+1]/sc2
-        ind += nadvance
-
-    return y_cum/nrecs
+    return np.mean(cum4x_segments(segments(w, nsamp, overlap), segments(x, nsamp, overlap), \
+            segments(y, nsamp, overlap), segments(z, nsamp, overlap), maxlag, k1, k2), 0)
 
 
 def cum3x (x, y, z, maxlag=0, nsamp=1, overlap=0, k1=0):
@@ -414,6 +396,62 @@ def test ():
     print cum4x(sampling(y,nsamp,2), sampling(y,nsamp,3), sampling(y,nsamp,5), sampling(y,nsamp,7), 2, 512, 0, 0, 0)
 
 
+# stream rotations averaged by cumx, as indices into pcs
+# The current rotation for 4th order assumes that the 1st and 2nd in pcs are 1
+ROTATION3 = [(0, 1, 2), (0, 2, 1), (2, 0, 1)]
+ROTATION4 = [(0, 1, 2, 3), (0, 2, 1, 3), (0, 3, 2, 1)]
+
+def cumx_segments (y, pcs, lags, maxlag=0, nsamp=0, overlap=0):
+    """
+    Per-segment contributions of several PCS cumulant slices.
+    The signal is sampled and segmented once for all the slices.
+         lags - list of (norder, k1, k2), one entry per slice
+         maxlag, nsamp, overlap - as in cumx
+         Return: list of (sums, counts), each (nrecs, nrot, 2*maxlag+1),
+                 such that cum2x.pooled(sums, counts) equals the cumx slice.
+    """
+    assert maxlag>0, "maxlag must be non-negative!"
+    assert nsamp>=0 and nsamp<len(y), "The number of samples is illigal!"
+    if nsamp == 0: nsamp = len(y)
+    norders = [k[0] for k in lags]
+    for norder in norders:
+        if norder not in (2, 3, 4):
+            raise Exception("Cumulant order must be 2, 3, or 4!")
+        assert len(pcs)>=norder, "There is not sufficient PCS coefficients!"
+    streams = [segments(sampling(y,nsamp,p), nsamp, overlap) for p in pcs[:max(norders)]]
+
+    # all the third-order slices come from one pass per rotation
+    k1s = [k1 for norder, k1, k2 in lags if norder == 3]
+    if k1s:
+        temp = [cum3x_slices_segments(streams[a], streams[b], streams[c], maxlag, k1s) for a, b, c in ROTATION3]
+        sums3 = np.stack([k[0] for k in temp], 2)
+        counts3 = np.stack([k[1] for k in temp], 2)
+    next3 = iter(range(len(k1s)))
+
+    result = []
+    for norder, k1, k2 in lags:
+        if norder == 2:
+            sums, counts = cum2x_segments(centering(streams[0]), centering(streams[1]), maxlag)
+            result.append((sums[:, np.newaxis, :], counts[:, np.newaxis, :]))
+        elif norder == 3:
+            k = next(next3)
+            result.append((sums3[:, k], counts3[:, k]))
+        else:
+            temp = np.stack([cum4x_segments(streams[a], streams[b], streams[c], streams[d], maxlag, k1, k2) \
+                    for a, b, c, d in ROTATION4], 1)
+            result.append((temp, np.ones(temp.shape)))
+    return result
+
+def cum3x_slices (y, pcs, maxlag=0, nsamp=0, overlap=0, k1s=[0]):
+    """
+    Several slices C3(m,k1) of the PCS third-order cumulant, from one pass over the segments.
+         k1s - the fixed lags of the slices
+         other parameters as in cumx
+         Return: (len(k1s), 2*maxlag+1) array, row k equals cumx(y, pcs, 3, maxlag, nsamp, overlap, k1s[k])
+    """
+    return np.array([pooled(sums, counts) for sums, counts in \
+            cumx_segments(y, pcs, [(3, k1, 0) for k1 in k1s], maxlag, nsamp, overlap)])
+
 def cumx (y, pcs, norder=2,maxlag=0,nsamp=0,overlap=0,k1=0,k2=0):
     """
     CUMEST Second-, third- or fourth-order cumulants.
@@ -428,38 +466,36 @@ def cumx (y, pcs, norder=2,maxlag=0,nsamp=0,overlap=0,k1=0,k2=0):
          y_cum  - C2(m) or C3(m,k1) or C4(m,k1,k2),  -maxlag <= m <= maxlag
                   depending upon the cumulant order selected
     """
-    assert maxlag>0, "maxlag must be non-negative!"
-    assert nsamp>=0 and nsamp<len(y), "The number of samples is illigal!"
-    if nsamp == 0: nsamp = len(y)
-    result = []
+    sums, counts = cumx_segments(y, pcs, [(norder, k1, k2)], maxlag, nsamp, overlap)[0]
+    return pooled(sums, counts)
 
-    if norder == 2:
-        assert len(pcs)>=2, "There is not sufficient PCS coefficients!"
-        return cum2x (sampling(y,nsamp,pcs[0]), sampling(y,nsamp,pcs[1]), maxlag, nsamp, overlap)
-    elif norder == 3:
-        assert len(pcs)>=3, "There is not sufficient PCS coefficients!"
-        result.append(cum3x_pcs (sampling(y,nsamp,pcs[0]), sampling(y,nsamp,pcs[1]), \
-                sampling(y,nsamp,pcs[2]), maxlag, nsamp, overlap, k1))
-        result.append(cum3x_pcs (sampling(y,nsamp,pcs[0]), sampling(y,nsamp,pcs[2]), \
-                sampling(y,nsamp,pcs[1]), maxlag, nsamp, overlap, k1))
-        result.append(cum3x_pcs (sampling(y,nsamp,pcs[2]), sampling(y,nsamp,pcs[0]), \
-                sampling(y,nsamp,pcs[1]), maxlag, nsamp, overlap, k1))
-    elif norder == 4:
-        assert len(pcs)>=4, "There is not sufficient PCS coefficients!"
-
-        # The current rotation assumes that the 1st and 2nd in pcs are 1
-        result.append(cum4x_pcs (sampling(y,nsamp,pcs[0]), sampling(y,nsamp,pcs[1]), sampling(y,nsamp,pcs[2]), \
-                sampling(y,nsamp,pcs[3]), maxlag, nsamp, overlap, k1, k2))
-        result.append(cum4x_pcs (sampling(y,nsamp,pcs[0]), sampling(y,nsamp,pcs[2]), sampling(y,nsamp,pcs[1]), \
-                sampling(y,nsamp,pcs[3]), maxlag, nsamp, overlap, k1, k2))
-        result.append(cum4x_pcs (sampling(y,nsamp,pcs[0]), sampling(y,nsamp,pcs[3]), sampling(y,nsamp,pcs[2]), \
-                sampling(y,nsamp,pcs[1]), maxlag, nsamp, overlap, k1, k2))
-    else:
-        raise Exception("Cumulant order must be 2, 3, or 4!")
-    
-    return np.mean(np.array(result), 0)
+def cumx_prefix (y, pcs, lengths, norder=2,maxlag=0,nsamp=0,overlap=0,k1=0,k2=0):
+    """
+    cumx of several prefixes of y, from one pass over the segments.
+         lengths - prefix lengths, each holding at least one segment
+         nsamp - samples per segment, should be given
+         other parameters as in cumx
+         Return: (len(lengths), 2*maxlag+1) array, row k equals cumx(y[:lengths[k]], pcs, ...)
+    """
+    assert nsamp > 0, "The number of samples per segment should be given!"
+    sums, counts = cumx_segments(y[:max(lengths)], pcs, [(norder, k1, k2)], maxlag, nsamp, overlap)[0]
+    return prefix_pooled(sums, counts, prefix_records(lengths, nsamp, overlap))
+
+def cumx_snr (y, noise, pcs, scales, norder=2,maxlag=0,nsamp=0,overlap=0,k1=0,k2=0):
+    """
+    cumx of y+a*noise for every noise scale a, e.g. every SNR of a sweep.
+    The estimate is a polynomial of degree norder in a, its coefficient tables
+    are computed once from norder+1 estimates, see cum2x.noise_polynomial.
+         noise - unit noise record, the same length as y
+         scales - the noise scales a
+         other parameters as in cumx
+         Return: (len(scales), 2*maxlag+1) array, row k equals cumx(y+scales[k]*noise, pcs, ...)
+    """
+    assert len(y) == len(noise), "The signal and the noise should be same length!"
+    y = np.asarray(y, dtype=float).flatten()
+    noise = np.asarray(noise, dtype=float).flatten()
+    return noise_polynomial(lambda a: cumx(y+a*noise, pcs, norder, maxlag, nsamp, overlap, k1, k2), \
+            norder, scales)
 
 if __name__=="__main__":
     test()
-
-
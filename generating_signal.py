@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 
 import numpy as np
 from numpy import log
+from realization import deviates
 
 rnormal = np.random.normal
 uniform = np.random.uniform
@@ -36,9 +37,10 @@ def save_signal(beta, nmc, length=709632):
     nmc: the # of monte carlo simulations
     size: the length of signal for each simulation
           (709632 = 7*8*9*11*128, 128 non-overlapping segment for 4-PCS)
+    The data are realization.deviates, so any block of them can also be regenerated alone.
     """
     for i in range(nmc):
-        signal = generater_expo(beta,length)
+        signal = deviates(i, 0, length, beta)
         np.save("../data/exp_deviate_one_%d.npy"%(i), signal)
         print "Save data for the %d round of monte carlo."%(i)
 
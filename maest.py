@@ -1,70 +1,387 @@
 import numpy as np
-from scipy.linalg import toeplitz, lstsq
-from cumest import cumest
-from cumxst import cumx
+from cumest import cumest, cumest_segments
+from cumxst import cumx, cumx_segments
+from cum2x import pooled
 
-def maestx(y, pcs, q, norder=3,samp_seg=1,overlap=0):
+def lower_toeplitz(c, ncol):
     """
-    MAEST  MA parameter estimation via the GM-RCLS algorithm, with Tugnait's fix
-        y  - time-series (vector or matrix)
-        q  - MA order
-        norder - cumulant-order to use  [default = 3]
-        samp_seg - samples per segment for cumulant estimation
-                  [default: length of y]
-        overlap - percentage overlap of segments  [default = 0]
-        flag - 'biased' or 'unbiased'          [default = 'biased']
-        Return: estimated MA parameter vector
+    Return the lower-triangular Toeplitz matrices toeplitz(c, [c[0],0,...,0]) with
+    ncol columns for every row of c, as a (nbatch, len(c[0]), ncol) array.
     """
-    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
-    nsamp = len(y)
-    overlap = max(0, min(overlap,99))
+    c = np.atleast_2d(c)
+    index = np.arange(c.shape[1])[:, np.newaxis] - np.arange(ncol)
+    return np.where(index >= 0, c[:, np.maximum(index, 0)], 0)
 
-    c2 = cumx(y, pcs, 2,q, samp_seg, overlap)
-    c2 = np.hstack((c2, np.zeros(q)))
-    cumd = cumx(y, pcs, norder,q,samp_seg,overlap,0,0)[::-1]
-    cumq = cumx(y, pcs, norder,q,samp_seg,overlap,q,q)
-    cumd = np.hstack((cumd, np.zeros(q)))
-    cumq[:q] = np.zeros(q)
+def gmrcls_system(c2, cumd, cumq, q):
+    """
+    Assemble the GM-RCLS system with Tugnait's fix for a batch of cumulants.
+        c2, cumd, cumq - (nbatch, 2q+1), see gmrcls
+        Return: (amat0, rvec0), of shape (nbatch, 4q, 2q+2) and (nbatch, 4q)
+    """
+    c2 = np.atleast_2d(c2)
+    nbatch = len(c2)
+    zeros = np.zeros((nbatch, q))
+    c2 = np.hstack((c2, zeros))
+    # c(q,0), c(q-1,0),..., c(0,0),..., c(-q,0)
+    # len(cumd) = 3q+1
+    cumd = np.hstack((np.atleast_2d(cumd)[:, ::-1], zeros))
+    # keep c(0,q), c(1,q),..., c(q,q) only, in reversed order
+    cumq = np.hstack((np.atleast_2d(cumq)[:, 2*q:q-1:-1], zeros))
 
-    cmat = toeplitz(cumd, np.hstack((cumd[0],np.zeros(q))))
-    rmat = toeplitz(c2,   np.hstack((c2[0],np.zeros(q))))
-    amat0 = np.hstack((cmat, -rmat[:,1:q+1]))
+    # combine 2nd-order with higher-order to find unique coefficients
+    cmat = lower_toeplitz(cumd, q+1)
+    rmat = lower_toeplitz(c2, q+1)
+    amat0 = np.concatenate((cmat, -rmat[:, :, 1:q+1], np.zeros((nbatch, 3*q+1, 1))), 2)
     rvec0 = c2
 
-    cumq = np.hstack((cumq[2*q:q-1:-1], np.zeros(q)))
-    cmat4 = toeplitz(cumq, np.hstack((cumq[0],np.zeros(q))))
-    c3   = cumd[:2*q+1]
-    amat0 = np.vstack((np.hstack((amat0, np.zeros((3*q+1,1)))), \
-            np.hstack((np.hstack((np.zeros((2*q+1,q+1)), cmat4[:,1:q+1])), \
-            np.reshape(-c3,(len(c3),1))))))
-    rvec0 = np.hstack((rvec0, -cmat4[:,0]))
+    # The Tugnait fix
+    # The original algo. has -c(k,q) for the coefficients, here are positive
+    # hence, the -c3 and -cmat4 added as the negative counterpart
+    cmat4 = lower_toeplitz(cumq, q+1)
+    c3 = cumd[:, :2*q+1]
+    amat0 = np.concatenate((amat0, np.concatenate((np.zeros((nbatch, 2*q+1, q+1)), \
+            cmat4[:, :, 1:q+1], -c3[:, :, np.newaxis]), 2)), 1)
+    rvec0 = np.hstack((rvec0, -cmat4[:, :, 0]))
 
+    # get rid of R(0) term
     row_sel = range(q)+range(2*q+1,3*q+1)+range(3*q+1,4*q+1)+range(4*q+2,5*q+2)
-    amat0 = amat0[row_sel,:]
-    rvec0 = rvec0[row_sel]
+    return amat0[:, row_sel, :], rvec0[:, row_sel]
+
+def gmrcls_lstsq(amat0, rvec0):
+    """
+    Least-squares solutions of a batch of GM-RCLS systems via one batched pseudo-inverse.
+        amat0, rvec0 - see gmrcls_system
+        Return: (bvec, residual), the (nbatch, 2q+2) solutions and the norms of amat0*bvec-rvec0
+    """
+    bvec = np.einsum('rij,rj->ri', np.linalg.pinv(amat0), rvec0)
+    residual = np.sqrt(np.sum((np.einsum('rij,rj->ri', amat0, bvec) - rvec0)**2, 1))
+    return bvec, residual
+
+def toeplitz_gram(seqs, cols, ranges):
+    """
+    Inner products between columns made of shifted sequences, restricted to some rows,
+    without forming the columns.
+    The products of two columns only depend on their shift difference d: the running
+    sums of s[m]*t[m+d] are formed for one d at a time, so the peak footprint is the
+    result plus nbatch*npairs*(n+2*max(j)+1) floats, npairs <= nseq**2 being the pairs
+    of sequences in use, against nbatch*rows*ncol for the dense columns.
+        seqs   - (nbatch, nseq, n) generating sequences
+        cols   - list of (k, j, sign): the column is sign*seqs[k] shifted down by j <= n
+        ranges - list of row ranges (a, b), a <= i < b <= n
+        Return: (nbatch, ncol, ncol) array of the inner products of the columns
+    """
+    nbatch, nseq, n = seqs.shape
+    k, js, sign = [np.array(c) for c in zip(*cols)]
+    shift = js.max()
+    # sp[m+shift] = s[m] and tp[p+2*shift] = t[p], zero out of the sequences
+    sp = np.concatenate((np.zeros((nbatch, nseq, shift)), seqs, np.zeros((nbatch, nseq, shift))), 2)
+    tp = np.concatenate((np.zeros((nbatch, nseq, 2*shift)), seqs, np.zeros((nbatch, nseq, 2*shift))), 2)
+    pair = k[:, np.newaxis]*nseq + k
+    nonzero = np.outer(sign, sign) != 0
+    used = np.unique(pair[nonzero])
+    lookup = np.zeros(nseq*nseq, dtype=int)
+    lookup[used] = np.arange(len(used))
+    pair = lookup[pair]
+    d = js[:, np.newaxis] - js
+
+    result = np.zeros((nbatch, len(cols), len(cols)))
+    for dd in range(-shift, shift+1):
+        rows, columns = np.nonzero((d == dd) & nonzero)
+        if not len(rows): continue
+        # running sums of s[m]*t[m+dd] for the pairs of sequences in use
+        cum = np.cumsum(sp[:, used/nseq]*tp[:, used%nseq, shift+dd:shift+dd+sp.shape[2]], 2)
+        cum = np.concatenate((np.zeros(cum.shape[:2]+(1,)), cum), 2)
+        for a, b in ranges:
+            result[:, rows, columns] += cum[:, pair[rows, columns], b-js[rows]+shift] - \
+                    cum[:, pair[rows, columns], a-js[rows]+shift]
+    return result*np.outer(sign, sign)
+
+def gmrcls_normal(c2, cumd, cumq, q):
+    """
+    Least-squares solutions of the GM-RCLS systems through the normal equations.
+    The Gram matrix of [A r] is accumulated from the Toeplitz structure of the
+    system of gmrcls_system, see toeplitz_gram, so that A is never formed.
+    The normal equations square the condition number of the system, prefer
+    gmrcls_lstsq for badly conditioned cumulants.
+        c2, cumd, cumq - (nbatch, 2q+1), see gmrcls
+        Return: (bvec, residual), as gmrcls_lstsq
+    """
+    c2 = np.atleast_2d(c2)
+    nbatch = len(c2)
+    zeros = np.zeros((nbatch, q))
+    # the generating sequences of the blocks, see gmrcls_system
+    seqs = np.array([np.hstack((c2, zeros)), \
+            np.hstack((np.atleast_2d(cumd)[:, ::-1], zeros)), \
+            np.hstack((np.atleast_2d(cumq)[:, 2*q:q-1:-1], zeros, zeros))])
+    seqs = np.transpose(seqs, (1, 0, 2))
+    c2, cumd, cumq = range(3)
+    zero = [(0, 0, 0)]
+
+    # columns of [A r] in the 2nd-order equations, rows 0..q-1 and 2q+1..3q
+    cols = [(cumd, j, 1) for j in range(q+1)] + [(c2, j, -1) for j in range(1, q+1)] + zero + [(c2, 0, 1)]
+    gram = toeplitz_gram(seqs, cols, [(0, q), (2*q+1, 3*q+1)])
+    # the Tugnait fix, rows 0..q-1 and q+1..2q
+    cols = zero*(q+1) + [(cumq, j, 1) for j in range(1, q+1)] + [(cumd, 0, -1), (cumq, 0, -1)]
+    gram += toeplitz_gram(seqs, cols, [(0, q), (q+1, 2*q+1)])
+
+    vec = gram[:, :-1, -1]
+    bvec = np.linalg.solve(gram[:, :-1, :-1], vec)
+    residual = np.sqrt(np.maximum(gram[:, -1, -1] - np.sum(bvec*vec, 1), 0))
+    return bvec, residual
+
+def tugnait_fix(bvec, q, norder=3):
+    """
+    MA parameters from the GM-RCLS solutions, with Tugnait's fix.
+        bvec - (nbatch, 2q+2) solutions, see gmrcls_lstsq
+        Return: (nbatch, q+1) estimated MA parameter vectors
+    """
+    b1 = bvec[:, 1:q+1]/bvec[:, :1]
+    b2 = bvec[:, q+1:2*q+1]
 
-    bvec = lstsq(amat0, rvec0)[0]
-    b1 = bvec[1:q+1]/bvec[0]
-    b2 = bvec[q+1:2*q+1]
     if norder == 3:
-        if all(b2 > 0):
-            b1 = np.sign(b1) * np.sqrt(0.5*(b1**2 + b2))
-        else:
+        valid = np.all(b2 > 0, 1)
+        for k in range(np.sum(~valid)):
             print 'MAEST: alternative solution b1 used'
+        b1 = np.where(valid[:, np.newaxis], np.sign(b1) * np.sqrt(0.5*np.abs(b1**2 + b2)), b1)
     else:
         b1 = np.sign(b2)* (abs(b1) + abs(b2)**(1./3))/2
-#        if all(np.sign(b2) == np.sign(b1)):
-#            b1 = np.sign(b1)* (abs(b1) + abs(b2)**(1./3))/2
-#        else:
-#            print 'MAEST: alternative solution b1 used'
-    return np.hstack(([1], b1))
+    return np.hstack((np.ones((len(b1), 1)), b1))
 
+def gmrcls_batch(c2, cumd, cumq, q, norder=3, solver='dense'):
+    """
+    GM-RCLS estimates for a batch of cumulants, solved together.
+        c2, cumd, cumq - (nbatch, 2q+1), one row per realization, see gmrcls
+        solver - 'dense': pseudo-inverse of the assembled system, see gmrcls_lstsq
+                 'normal': structured normal equations, see gmrcls_normal
+        Return: (nbatch, q+1) estimated MA parameter vectors
+    """
+    if solver == 'dense':
+        bvec, residual = gmrcls_lstsq(*gmrcls_system(c2, cumd, cumq, q))
+    elif solver == 'normal':
+        bvec, residual = gmrcls_normal(c2, cumd, cumq, q)
+    else:
+        raise Exception("The solver should be either 'dense' or 'normal'!!")
+    return tugnait_fix(bvec, q, norder)
 
-def maest(y,q, norder=3,samp_seg=1,overlap=0,flag='unbiased'):
+def gmrcls(c2, cumd, cumq, q, norder=3, solver='dense'):
+    """
+    Solve the GM-RCLS system, with Tugnait's fix, for the MA parameters.
+        c2   - C2(m),                  -q <= m <= q
+        cumd - C3(m,0) or C4(m,0,0),   -q <= m <= q
+        cumq - C3(m,q) or C4(m,q,q),   -q <= m <= q
+        q  - MA order
+        norder - cumulant-order of cumd and cumq  [default = 3]
+        solver - 'dense' or 'normal', see gmrcls_batch  [default = 'dense']
+        Return: estimated MA parameter vector
+    """
+    return gmrcls_batch(c2, cumd, cumq, q, norder, solver)[0]
+
+
+class CumulantContext(object):
+    """
+    The cumulants used by the GM-RCLS algorithm, from one segmentation of y:
+    C2(m), the diagonal slice C(m,0,0) and the slice C(m,q,q), -q <= m <= q.
+    Every statistic keeps its per-segment contributions as (sums, counts),
+    see cum2x.pooled, so that subsets of the segments can be solved as well.
+        stats  - [(sums, counts)] for c2, cumd and cumq
+        q      - MA order
+        norder - cumulant-order of cumd and cumq
+    """
+    def __init__(self, stats, q, norder=3):
+        self.stats = stats
+        self.q = q
+        self.norder = norder
+
+    def cumulants(self, rows=None):
+        """Return (c2, cumd, cumq), using only the segments in rows if given."""
+        result = []
+        for sums, counts in self.stats:
+            if rows is not None:
+                sums = sums[rows]
+                counts = counts[rows]
+            result.append(pooled(sums, counts))
+        return result
+
+    def solve(self, rows=None):
+        """Return the estimated MA parameter vector."""
+        c2, cumd, cumq = self.cumulants(rows)
+        return gmrcls(c2, cumd, cumq, self.q, self.norder)
+
+    def bootstrap(self, nboot=200, alpha=0.05, seed=None):
+        """
+        Segment bootstrap: resample the segments with replacement nboot times
+        and solve the small system of every replicate, the cumulants are not recomputed.
+            nboot - number of bootstrap replicates  [default = 200]
+            alpha - the percentile interval covers 1-alpha  [default = 0.05]
+            seed  - seed of the resampling  [default: None]
+            Return: (estimate, lower, upper, replicates); lower and upper are the
+                    alpha/2 and 1-alpha/2 percentiles of the (nboot, q+1) replicates
+        """
+        nrecs = len(self.stats[0][0])
+        assert nrecs > 1, "The bootstrap needs more than one segment!"
+        rows = np.random.RandomState(seed).randint(0, nrecs, (nboot, nrecs))
+        # how many times every segment is drawn in every replicate
+        weight = np.zeros((nboot, nrecs))
+        for k in range(nboot):
+            weight[k] = np.bincount(rows[k], minlength=nrecs)
+        c2, cumd, cumq = [np.mean(np.einsum('bn,nrl->brl', weight, sums) \
+                / np.einsum('bn,nrl->brl', weight, counts), 1) for sums, counts in self.stats]
+        replicates = gmrcls_batch(c2, cumd, cumq, self.q, self.norder)
+        lower, upper = np.percentile(replicates, [50.*alpha, 100.-50.*alpha], 0)
+        return self.solve(), lower, upper, replicates
+
+
+def ma_lags(q, norder):
+    """The (norder, k1, k2) slices used by the GM-RCLS algorithm."""
+    return [(2, 0, 0), (norder, 0, 0), (norder, q, q)]
+
+def sweep_lags(q_max, norder):
+    """The slices for every MA order up to q_max: C2, C(m,0,0) and C(m,q,q), q = 1..q_max."""
+    return [(2, 0, 0), (norder, 0, 0)] + [(norder, q, q) for q in range(1, q_max+1)]
+
+def order_sweep(stats, q_max, norder=3):
+    """
+    GM-RCLS estimates for every MA order 1 <= q <= q_max from one cumulant table.
+    The lower orders use the central 2q+1 lags of C2 and C(m,0,0), which are
+    the same as the ones estimated with maxlag q.
+        stats  - [(sums, counts)] of sweep_lags(q_max, norder), estimated with maxlag q_max
+        Return: (taps, residual): the q_max estimated MA parameter vectors (taps[q-1]
+                has q+1 entries) and the residual norms of their least-squares systems
+    """
+    c2 = pooled(*stats[0])
+    cumd = pooled(*stats[1])
+    taps = []
+    residual = np.zeros(q_max)
+    for q in range(1, q_max+1):
+        window = slice(q_max-q, q_max+q+1)
+        cumq = pooled(*stats[q+1])[window]
+        bvec, temp = gmrcls_lstsq(*gmrcls_system(c2[np.newaxis, window], \
+                cumd[np.newaxis, window], cumq[np.newaxis], q))
+        taps.append(tugnait_fix(bvec, q, norder)[0])
+        residual[q-1] = temp[0]
+    return taps, residual
+
+def maest_sweep(y, q_max, norder=3, samp_seg=1, overlap=0, flag='unbiased'):
+    """maest for every MA order up to q_max, see order_sweep and maest."""
+    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
+    overlap = max(0, min(overlap,99))
+    return order_sweep(cumest_segments(y, sweep_lags(q_max, norder), q_max, samp_seg, overlap, flag), \
+            q_max, norder)
+
+def maestx_sweep(y, pcs, q_max, norder=3, samp_seg=1, overlap=0):
+    """maestx for every MA order up to q_max, see order_sweep and maestx."""
+    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
+    overlap = max(0, min(overlap,99))
+    return order_sweep(cumx_segments(y, pcs, sweep_lags(q_max, norder), q_max, samp_seg, overlap), \
+            q_max, norder)
+
+def context(y, q, norder=3, samp_seg=1, overlap=0, flag='unbiased'):
+    """CumulantContext of maest, see maest for the parameters."""
+    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
+    overlap = max(0, min(overlap,99))
+    return CumulantContext(cumest_segments(y, ma_lags(q, norder), q, samp_seg, overlap, flag), q, norder)
+
+def contextx(y, pcs, q, norder=3, samp_seg=1, overlap=0):
+    """CumulantContext of maestx, see maestx for the parameters."""
+    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
+    overlap = max(0, min(overlap,99))
+    return CumulantContext(cumx_segments(y, pcs, ma_lags(q, norder), q, samp_seg, overlap), q, norder)
+
+def solve_batch(contexts, solver='dense'):
+    """
+    Solve the GM-RCLS systems of several CumulantContext together.
+    All the contexts should share the same q and norder.
+        solver - 'dense' or 'normal', see gmrcls_batch  [default = 'dense']
+        Return: (len(contexts), q+1) estimated MA parameter vectors
+    """
+    q = contexts[0].q
+    norder = contexts[0].norder
+    c2, cumd, cumq = [np.array(k) for k in zip(*[c.cumulants() for c in contexts])]
+    return gmrcls_batch(c2, cumd, cumq, q, norder, solver)
+
+class RecursiveMA(object):
+    """
+    Online GM-RCLS estimation, refreshed as every new segment of samples arrives.
+    The samples may come in chunks of any length; every completed segment adds its
+    contributions to running (sums, counts) accumulators, see cum2x.pooled, and the
+    small GM-RCLS system is solved again from the running cumulants, so the cost
+    per segment does not grow with the length of the record.
+    With forget = 1 and the whole record fed, the estimate equals the one of
+    maest (pcs is None) or maestx.
+        q        - MA order
+        samp_seg - samples per segment
+        norder   - cumulant-order to use  [default = 3]
+        overlap  - percentage overlap of segments  [default = 0]
+        pcs      - PCS coefficients for the estimates of maestx  [default: None, maest]
+        flag     - 'biased' or 'unbiased', maest only  [default = 'unbiased']
+        forget   - weight of the past segments at every new one, 0 < forget <= 1  [default = 1]
+    """
+    def __init__(self, q, samp_seg, norder=3, overlap=0, pcs=None, flag='unbiased', forget=1.):
+        assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
+        assert samp_seg > 0, "The number of samples is illigal!"
+        assert forget > 0 and forget <= 1, "The forgetting factor should be in (0, 1]!"
+        self.q = q
+        self.norder = norder
+        self.samp_seg = samp_seg
+        self.nadvance = samp_seg - max(0, min(overlap,99))/100*samp_seg
+        self.pcs = pcs
+        self.flag = flag
+        self.forget = forget
+        self.buffer = np.zeros(0)
+        self.stats = None
+        self.nrecs = 0
+        self.estimate = None
+
+    def contributions(self, x):
+        """Return [(sums, counts)] of the single segment x, each (nrot, 2q+1)."""
+        if self.pcs is None:
+            stats = cumest_segments(x, ma_lags(self.q, self.norder), self.q, 0, 0, self.flag)
+        else:
+            stats = cumx_segments(x, self.pcs, ma_lags(self.q, self.norder), self.q, 0, 0)
+        return [(sums[0], counts[0]) for sums, counts in stats]
+
+    def update(self, x):
+        """
+        Feed new samples.
+            Return: the estimated MA parameter vector after the completed segments,
+                    None while no segment has been completed yet
+        """
+        self.buffer = np.concatenate((self.buffer, np.asarray(x, dtype=float).flatten()))
+        updated = False
+        while len(self.buffer) >= self.samp_seg:
+            stats = self.contributions(self.buffer[:self.samp_seg])
+            if self.stats is None:
+                self.stats = stats
+            else:
+                self.stats = [(self.forget*sums + s, self.forget*counts + c) \
+                        for (sums, counts), (s, c) in zip(self.stats, stats)]
+            self.buffer = self.buffer[self.nadvance:]
+            self.nrecs += 1
+            updated = True
+        if updated:
+            self.estimate = self.solve()
+        return self.estimate
+
+    def solve(self):
+        """Return the estimated MA parameter vector from the running cumulants."""
+        c2, cumd, cumq = [pooled(sums[np.newaxis], counts[np.newaxis]) for sums, counts in self.stats]
+        return gmrcls(c2, cumd, cumq, self.q, self.norder)
+
+def maestx_batch(ys, pcs, q, norder=3, samp_seg=1, overlap=0, solver='dense'):
+    """
+    maestx over a stack of Monte Carlo realizations.
+        ys - (R, N) array or list of R time-series
+        solver - 'dense' or 'normal', see gmrcls_batch  [default = 'dense']
+        other parameters as in maestx
+        Return: (R, q+1) estimated MA parameter vectors, one row per realization
+    """
+    return solve_batch([contextx(y, pcs, q, norder, samp_seg, overlap) for y in ys], solver)
+
+def maestx(y, pcs, q, norder=3,samp_seg=1,overlap=0):
     """
     MAEST  MA parameter estimation via the GM-RCLS algorithm, with Tugnait's fix
         y  - time-series (vector or matrix)
-        q  - MA order (equivalent to maxlag in cumest)
+        q  - MA order
         norder - cumulant-order to use  [default = 3]
         samp_seg - samples per segment for cumulant estimation
                   [default: length of y]
@@ -72,61 +389,30 @@ def maest(y,q, norder=3,samp_seg=1,overlap=0,flag='unbiased'):
         flag - 'biased' or 'unbiased'          [default = 'biased']
         Return: estimated MA parameter vector
     """
-    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
-    nsamp = len(y)
-    overlap = max(0, min(overlap,99))
+    return contextx(y, pcs, q, norder, samp_seg, overlap).solve()
 
-    c2 = cumest(y,2,q, samp_seg, overlap, flag)
-    c2 = np.hstack((c2, np.zeros(q)))
-    # c(q,0), c(q-1,0),..., c(0,0),..., c(-q,0)
-    cumd = cumest(y,norder,q,samp_seg,overlap,flag,0,0)[::-1]
-    #cumq = cumest(y,norder,q,samp_seg,overlap,flag,q,0)
-    cumq = cumest(y,norder,q,samp_seg,overlap,flag,q,q)
 
-    # len(cumd) = 3q+1
-    cumd = np.hstack((cumd, np.zeros(q)))
-    # get rid of c(-q,q), c(-q+1,q)...c(-1,q)
-    # and left: 0,...,0, c(0,q), c(1,q),..., c(q,q)
-    cumq[:q] = np.zeros(q)
-
-    # combine 2nd-order with higher-order to find unique coefficients
-    cmat = toeplitz(cumd, np.hstack((cumd[0],np.zeros(q))))
-    rmat = toeplitz(c2,   np.hstack((c2[0],np.zeros(q))))
-    amat0 = np.hstack((cmat, -rmat[:,1:q+1]))
-    rvec0 = c2
+def maest_bootstrap(y, q, norder=3, samp_seg=1, overlap=0, flag='unbiased', nboot=200, alpha=0.05, seed=None):
+    """maest with segment-bootstrap percentile intervals, see CumulantContext.bootstrap."""
+    return context(y, q, norder, samp_seg, overlap, flag).bootstrap(nboot, alpha, seed)
 
-    # The Tugnait fix
-    # The original algo. has -c(k,q) for the coefficients, here are positive
-    # hence, the -c3 and -cmat4 added as the negative counterpart
-    cumq = np.hstack((cumq[2*q:q-1:-1], np.zeros(q)))
-    cmat4 = toeplitz(cumq, np.hstack((cumq[0],np.zeros(q))))
-    c3 = cumd[:2*q+1]
-    amat0 = np.vstack((np.hstack((amat0, np.zeros((3*q+1,1)))), \
-            np.hstack((np.hstack((np.zeros((2*q+1,q+1)), cmat4[:,1:q+1])), \
-            np.reshape(-c3,(len(c3),1))))))
-    rvec0 = np.hstack((rvec0, -cmat4[:,0]))
+def maestx_bootstrap(y, pcs, q, norder=3, samp_seg=1, overlap=0, nboot=200, alpha=0.05, seed=None):
+    """maestx with segment-bootstrap percentile intervals, see CumulantContext.bootstrap."""
+    return contextx(y, pcs, q, norder, samp_seg, overlap).bootstrap(nboot, alpha, seed)
 
-    # get rid of R(0) term
-    row_sel = range(q)+range(2*q+1,3*q+1)+range(3*q+1,4*q+1)+range(4*q+2,5*q+2)
-    amat0 = amat0[row_sel,:]
-    rvec0 = rvec0[row_sel]
-
-    bvec = lstsq(amat0, rvec0)[0]
-    b1 = bvec[1:q+1]/bvec[0]
-    b2 = bvec[q+1:2*q+1]
-
-    if norder == 3:
-        if all(b2 > 0):
-            b1 = np.sign(b1) * np.sqrt(0.5*(b1**2 + b2))
-        else:
-            print 'MAEST: alternative solution b1 used'
-    else:
-        b1 = np.sign(b2)* (abs(b1) + abs(b2)**(1./3))/2
-#        if all(np.sign(b2) == np.sign(b1)):
-#            b1 = np.sign(b1)* (abs(b1) + abs(b2)**(1./3))/2
-#        else:
-#            print 'MAEST: alternative solution b1 used'
-    return np.hstack(([1], b1))
+def maest(y,q, norder=3,samp_seg=1,overlap=0,flag='unbiased'):
+    """
+    MAEST  MA parameter estimation via the GM-RCLS algorithm, with Tugnait's fix
+        y  - time-series (vector or matrix)
+        q  - MA order (equivalent to maxlag in cumest)
+        norder - cumulant-order to use  [default = 3]
+        samp_seg - samples per segment for cumulant estimation
+                  [default: length of y]
+        overlap - percentage overlap of segments  [default = 0]
+        flag - 'biased' or 'unbiased'          [default = 'biased']
+        Return: estimated MA parameter vector
+    """
+    return context(y, q, norder, samp_seg, overlap, flag).solve()
 
 
 def test():
@@ -137,6 +423,17 @@ def test():
     # [ 1.          0.9607745   0.44815601 -0.73434479]
     print maest(y, 3, 4, 256)
 
+def benchmark(qs=(2, 5, 10, 20), nbatch=100, repeat=20):
+    """Time the dense and the structured GM-RCLS solvers on random cumulants."""
+    import time
+    for q in qs:
+        c2, cumd, cumq = np.random.randn(3, nbatch, 2*q+1)
+        for solver in ('dense', 'normal'):
+            start = time.time()
+            for k in range(repeat):
+                gmrcls_batch(c2, cumd, cumq, q, 4, solver)
+            print "q=%d, nbatch=%d, %s: %.3f ms"%(q, nbatch, solver, (time.time()-start)/repeat*1e3)
+
 
 if __name__=="__main__":
     test()
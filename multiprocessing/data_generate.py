@@ -1,27 +1,23 @@
 import numpy as np
 from cumxst import cumx
 from cumest import cumest
-import impulse_response as ir
 from multiprocessing import Process
 from multiprocessing import Pool
-from math import sqrt
-from scipy.signal import lfilter
+from realization import record, records
 
-# now it can only deal with one choice of sig_tap
-def signal_through_ma_channel(sig_tap, noise_tap, i):
-    signal = np.load("/home/creasy/workplace/data/exp_deviate_one_%d.npy"%(i))[:210000]
-    receive = ir.moving_average(sig_tap, signal)
+# the records are those of realization.record, so a driver may also regenerate them in memory
+def save_records(prefix, kind, sig_tap, noise_tap, snrs, i, length):
+    """Save the noise-free record and the white and color records of every snr, one grid at a time."""
     # save signal snr=+inf
-    np.save("temp/ma_data_%d.npy"%(i), receive)
+    np.save("temp/%s_%d.npy"%(prefix, i), record(kind, sig_tap, noise_tap, 1000, "white", i, length))
+    for noise_type in ("white", "color"):
+        for j, temp in zip(snrs, records(kind, sig_tap, noise_tap, snrs, noise_type, i, length)):
+            np.save("temp/%s_%s_%d_%d.npy"%(prefix, noise_type, j, i), temp)
 
+# now it can only deal with one choice of sig_tap
+def signal_through_ma_channel(sig_tap, noise_tap, i):
     # snr = 0..20 (scale from 1 to 100)
-    for j in range(-10,21):
-        amp = 10**(j/10.)
-        white = np.random.normal(0, sqrt(sum(sig_tap)**2/amp), len(signal))
-        color_scale = sqrt(sum(sig_tap)**2/amp/(sum(noise_tap)**2))
-        color = ir.moving_average(noise_tap, np.random.normal(0, color_scale, len(signal)))
-        np.save("temp/ma_data_white_%d_%d.npy"%(j, i), white+receive)
-        np.save("temp/ma_data_color_%d_%d.npy"%(j, i), color+receive)
+    save_records("ma_data", 'ma', sig_tap, noise_tap, range(-10,21), i, 210000)
 
 
 def ma_gen():
@@ -39,19 +35,8 @@ def ma_gen():
 
 
 def signal_through_ar_channel(sig_tap, noise_tap, i):
-    signal = np.load("/home/creasy/workplace/data/exp_deviate_one_%d.npy"%(i))[:210000]
-    receive = lfilter([1], sig_tap, signal)
-    # save signal snr=+inf
-    np.save("temp/ar_data_%d.npy"%(i), receive)
-
     # snr = 0..20 (scale from 1 to 100)
-    for j in range(-10,21):
-        amp = 10**(j/10.)
-        white = np.random.normal(0, sqrt(sum(sig_tap)**2/amp), len(signal))
-        color_scale = sqrt(sum(sig_tap)**2/amp/(sum(noise_tap)**2))
-        color = lfilter([1], noise_tap, np.random.normal(0, color_scale, len(signal)))
-        np.save("temp/ar_data_white_%d_%d.npy"%(j, i), white+receive)
-        np.save("temp/ar_data_color_%d_%d.npy"%(j, i), color+receive)
+    save_records("ar_data", 'ar', sig_tap, noise_tap, range(-10,21), i, 210000)
 
 def ar_gen():
     job = Pool(8)
@@ -68,21 +53,8 @@ def ar_gen():
 
 
 def arma_channel(sig_ar_tap, sig_ma_tap, noise_ar_tap, noise_ma_tap, i):
-    signal = np.load("/home/creasy/workplace/data/exp_deviate_one_%d.npy"%(i))[:60000]
-    receive = lfilter(sig_ma_tap, sig_ar_tap, signal)
-    # save signal snr=+inf
-    np.save("temp/arma_data_%d.npy"%(i), receive)
-    sig_power = (sum(sig_ar_tap)+sum(sig_ma_tap))**2
-    noise_power = (sum(noise_ar_tap)+sum(noise_ma_tap))**2
-
     # snr = 0..20 (scale from 1 to 100)
-    for j in range(0,21):
-        amp = 10**(j/10.)
-        white = np.random.normal(0, sqrt(sig_power/amp), len(signal))
-        color_scale = sqrt(sig_power/amp/noise_power)
-        color = lfilter(noise_ma_tap, noise_ar_tap, np.random.normal(0, color_scale, len(signal)))
-        np.save("temp/arma_data_white_%d_%d.npy"%(j, i), white+receive)
-        np.save("temp/arma_data_color_%d_%d.npy"%(j, i), color+receive)
+    save_records("arma_data", 'arma', (sig_ar_tap, sig_ma_tap), (noise_ar_tap, noise_ma_tap), range(0,21), i, 60000)
 
 def arma_gen():
     job = Pool(8)
@@ -6,6 +6,11 @@ import nested_cumxst as ncx
 import impulse_response as ir
 from multiprocessing import Process
 from multiprocessing import Pool
+import realization
+from realization import base, share
+
+# the base signals, loaded once by share into a map read by all the workers
+realization.BASE = "../data/exp_deviate_one_%d.npy"
 
 def task_nma(pcs, taps, winsize, r, slicing):
     if len(taps) <= 3:
@@ -14,10 +19,9 @@ def task_nma(pcs, taps, winsize, r, slicing):
         file_tag = "long"
 
     f = open("../result/mns_montecarlo_%s_ma%d_%d_slice%d_%d.csv"%(file_tag, len(pcs), winsize, slicing, int(''.join(map(str,pcs)))), 'w')
-    for i in range(r):
-        signal = np.load("../data/exp_deviate_one_%d.npy"%(i))[:slicing]
-        receive = ir.moving_average(taps, signal)
-        temp = nma.maestx (receive, pcs, len(taps)-1, len(pcs), winsize)
+    scheme = ncx.NestedScheme(pcs, slicing)
+    receive = [ir.moving_average(taps, base(i, slicing)) for i in range(r)]
+    for temp in nma.maestx_batch (receive, scheme, len(taps)-1, len(pcs), winsize):
         f.write('%s\n' % temp)
         print temp
     f.close()
@@ -30,10 +34,11 @@ def task_ncx(pcs, taps, winsize, r, slicing):
         file_tag = "long"
 
     f = open("../result/mns_montecarlo_%s_cx%d_%d_%d_slice%d.csv"%(file_tag, len(pcs), winsize, int(''.join(map(str,pcs))), slicing), 'w')
+    scheme = ncx.NestedScheme(pcs, slicing)
     for i in range(r):
-        signal = np.load("../data/exp_deviate_one_%d.npy"%(i))[:slicing]
+        signal = base(i, slicing)
         receive = ir.moving_average(taps, signal)
-        temp = ncx.cumx(receive, pcs, len(pcs), len(taps)-1, winsize)
+        temp = ncx.cumx(receive, scheme, len(pcs), len(taps)-1, winsize)
         f.write('%s\n' % temp)
         print temp
     f.close()
@@ -46,10 +51,8 @@ def task_ma(pcs, taps, winsize, r, slicing):
         file_tag = "long"
 
     f = open("../result/pcs_montecarlo_%s_ma%d_%d_slice%d_%d.csv"%(file_tag, len(pcs), winsize, slicing, int(''.join(map(str,pcs)))), 'w')
-    for i in range(r):
-        signal = np.load("../data/exp_deviate_one_%d.npy"%(i))[:slicing]
-        receive = ir.moving_average(taps, signal)
-        temp = ma.maestx (receive, pcs, len(taps)-1, len(pcs), winsize)
+    receive = [ir.moving_average(taps, base(i, slicing)) for i in range(r)]
+    for temp in ma.maestx_batch (receive, pcs, len(taps)-1, len(pcs), winsize):
         f.write('%s\n' % temp)
         print temp
     f.close()
@@ -63,7 +66,7 @@ def task_cx(pcs, taps, winsize, r, slicing):
 
     f = open("../result/pcs_montecarlo_%s_cx%d_%d_%d_slice%d.csv"%(file_tag, len(pcs), winsize, int(''.join(map(str,pcs))), slicing), 'w')
     for i in range(r):
-        signal = np.load("../data/exp_deviate_one_%d.npy"%(i))[:slicing]
+        signal = base(i, slicing)
         receive = ir.moving_average(taps, signal)
         temp = cx.cumx(receive, pcs, len(pcs), len(taps)-1, winsize)
         f.write('%s\n' % temp)
@@ -72,8 +75,9 @@ def task_cx(pcs, taps, winsize, r, slicing):
 
 
 def main():
-    job = Pool(8)
     r = 50
+    share(r, 700000)
+    job = Pool(8)
     winsize = 512
     
 
@@ -4,6 +4,11 @@ import cumxst as cx
 import impulse_response as ir
 from multiprocessing import Process
 from multiprocessing import Pool
+import realization
+from realization import base, share
+
+# the base signals, loaded once by share into a map read by all the workers
+realization.BASE = "/home/work/rsls/data/exp_deviate_one_%d.npy"
 
 def task(pcs, taps, winsize, r, slicing):
   if len(taps) <= 3:
@@ -13,7 +18,7 @@ def task(pcs, taps, winsize, r, slicing):
 
   f = open("ma_test_%s_hos%d_%d_slice%d_%d.csv"%(file_tag, len(pcs), winsize, slicing, int(''.join(map(str,pcs)))), 'w')
   for i in range(r):
-    signal = np.load("/home/work/rsls/data/exp_deviate_one_%d.npy"%(i))[:slicing]
+    signal = base(i, slicing)
     receive = ir.moving_average(taps, signal)
     temp = ma.maestx (receive, len(taps)-1, len(pcs), winsize)
     f.write('%s\n' % temp)
@@ -29,7 +34,7 @@ def task_cx(pcs, taps, winsize, r, slicing):
 
   f = open("cumulant_test_%s_cx%d_%d_%d_slice%d.csv"%(file_tag, len(pcs), winsize, int(''.join(map(str,pcs))), slicing), 'w')
   for i in range(r):
-    signal = np.load("/home/work/rsls/data/exp_deviate_one_%d.npy"%(i))[:slicing]
+    signal = base(i, slicing)
     receive = ir.moving_average(taps, signal)
     temp = cx.cumx(receive, pcs, len(pcs), len(taps)-1, winsize)
     f.write('%s\n' % temp)
@@ -37,8 +42,9 @@ def task_cx(pcs, taps, winsize, r, slicing):
   f.close()
 
 def main():
-  job = Pool(8)
   r = 50
+  share(r, 700000)
+  job = Pool(8)
   winsize = 512
   
 
@@ -4,6 +4,11 @@ import maest_com as ma_com
 import impulse_response as ir
 from multiprocessing import Process
 from multiprocessing import Pool
+import realization
+from realization import base, share
+
+# the base signals, loaded once by share into a map read by all the workers
+realization.BASE = "/home/work/data/exp_deviate_one_%d.npy"
 
 def task(pcs, taps, winsize, r):
   if len(taps) <= 3:
@@ -12,10 +17,8 @@ def task(pcs, taps, winsize, r):
     file_tag = "long"
 
   f = open("pcs_montecarlo_%s_ma%d_%d_%d.csv"%(file_tag, len(pcs), winsize, int(''.join(map(str,pcs)))), 'w')
-  for i in range(r):
-    signal = np.load("/home/work/data/exp_deviate_one_%d.npy"%(i))
-    receive = ir.moving_average(taps, signal)
-    temp = ma.maestx (receive, pcs, len(taps)-1, len(pcs), winsize)
+  receive = [ir.moving_average(taps, base(i, 709632)) for i in range(r)]
+  for temp in ma.maestx_batch (receive, pcs, len(taps)-1, len(pcs), winsize):
     f.write('%s\n' % temp)
     print temp
   f.close()
@@ -29,7 +32,7 @@ def task_com(pcs, taps, winsize, r):
 
   f = open("pcs_montecarlo_%s_ma%d_%d_%d.csv"%(file_tag, len(pcs), winsize, int(''.join(map(str,pcs)))), 'w')
   for i in range(r):
-    signal = np.load("/home/work/data/exp_deviate_one_%d.npy"%(i))
+    signal = base(i, 709632)
     receive = ir.moving_average(taps, signal)
     temp = ma_com.maestx (receive, pcs, len(taps)-1, len(pcs), winsize)
     f.write('%s\n' % temp)
@@ -38,8 +41,9 @@ def task_com(pcs, taps, winsize, r):
 
 
 def main():
-  job = Pool(23)
   r = 50
+  share(r, 709632)
+  job = Pool(23)
 
   taps = [1, -2.333, 0.667]
   pcs_lst = [[1,1,2,3], [1,1,2,5], [1,1,2,7], [1,1,3,5]]
@@ -1,6 +1,6 @@
 import numpy as np
 from cumest import cum2est, cum3est, cum4est
-from sys import maxint
+from cum2x import segments, centering, pooled
 
 def sampling (signal, winsize, factor):
     """
@@ -9,198 +9,144 @@ def sampling (signal, winsize, factor):
     The downsampling is performed **within** every winsize
     NOTE: it is different from the same function in "sampling.py".
     """
-    return np.array([signal[k] if (k%winsize)%factor==0 else 0 for k in range(len(signal))])
+    return np.where((np.arange(len(signal))%winsize)%factor==0, signal, 0)
+
+def cum2_self (xs, maxlag):
+    """
+    Lag products of the segments xs for the lags 0..maxlag.
+    The auto-covariance is symmetric, C2(-m) = C2(m), so only the
+    non-negative lags are computed.
+    Return: (sums, counts), both (nrecs, maxlag+1).
+    """
+    nrecs, nsamp = xs.shape
+    sums = np.zeros((nrecs, maxlag+1))
+    counts = np.zeros((nrecs, maxlag+1))
+    for m in range(maxlag+1):
+        temp = xs[:, m:]*xs[:, :nsamp-m]
+        sums[:, m] = np.sum(temp, 1)
+        counts[:, m] = np.sum(temp != 0, 1)
+    return sums, counts
+
+def mirror (half):
+    """Return [c(maxlag),...,c(1),c(0),c(1),...,c(maxlag)] along the last axis."""
+    return np.concatenate((half[..., :0:-1], half), -1)
 
 def cum2x (y, maxlag, nsamp, overlap):
     assert maxlag >= 0, " 'maxlag' must be non-negative!"
-    x = y # cope with the lagacy code. need refactoring....
-
-    if nsamp > len(x) or nsamp <= 0:
-        nsamp = len(x)
-    overlap = overlap/100*nsamp
-    nadvance = nsamp - overlap
-    nrecs  = (len(x)-overlap)/nadvance
-    nlags = 2*maxlag+1
-    y_cum = np.zeros(nlags, dtype=float)
-    count = np.zeros(nlags, dtype=float)
+    if nsamp > len(y) or nsamp <= 0:
+        nsamp = len(y)
+    sums, counts = cum2_self(centering(segments(y, nsamp, overlap)), maxlag)
+    return mirror(np.sum(sums, 0)/np.sum(counts, 0))
 
-    ind = 0
-    for k in range(nrecs):
-        xs = x[ind:(ind+nsamp)]
-        xs = np.array([j-float(sum(xs))/sum(1 for i in xs if i!=0) if j!=0 else 0 for j in xs])
-        ys = y[ind:(ind+nsamp)]
-        ys = np.array([j-float(sum(ys))/sum(1 for i in ys if i!=0) if j!=0 else 0 for j in ys])
-        temp = xs*ys
-        y_cum[maxlag] += reduce(lambda m,n:m+n,temp, 0)
-        count[maxlag] += sum(1 for i in temp if i!=0)
-        for m in range(1,maxlag+1):
-            temp = xs[m:nsamp]*ys[:nsamp-m]
-            y_cum[maxlag-m] = y_cum[maxlag-m]+reduce(lambda i,j:i+j,temp, 0)
-            count[maxlag-m] += sum(1 for i in temp if i!=0)
-            temp = xs[:nsamp-m]*ys[m:nsamp]
-            y_cum[maxlag+m] = y_cum[maxlag+m]+reduce(lambda i,j:i+j,temp, 0)
-            count[maxlag+m] += sum(1 for i in temp if i!=0)
-        ind += nadvance
-    scale = 1./count
-    return y_cum*scale
+def cum3_self (xs, lags):
+    """
+    Third-order lag products of the segments xs.
+        lags - list of (k1, m) pairs
+    The sample sum of x(n)x(n+k1)x(n+m) over a segment only depends on the
+    set {0, k1, m} up to a shift, which gives the six symmetries of C3.
+    Every pair is reduced to the non-redundant region 0 <= a <= b, and each
+    distinct (a, b) is computed once and mirrored to all the pairs sharing it.
+    Return: (sums, counts), both (nrecs, len(lags)).
+    """
+    nrecs, nsamp = xs.shape
+    sums = np.zeros((nrecs, len(lags)))
+    counts = np.zeros((nrecs, len(lags)))
+    cache = {}
+    prod = {}
+    for j in range(len(lags)):
+        lag = sorted([0, lags[j][0], lags[j][1]])
+        a = lag[1]-lag[0]
+        b = lag[2]-lag[0]
+        if (a, b) not in cache:
+            if b >= nsamp:
+                cache[(a, b)] = (0, 0)
+            else:
+                if a not in prod:
+                    prod[a] = xs[:, :nsamp-a]*xs[:, a:]
+                temp = prod[a][:, :nsamp-b]*xs[:, b:]
+                cache[(a, b)] = (np.sum(temp, 1), np.sum(temp != 0, 1))
+        sums[:, j], counts[:, j] = cache[(a, b)]
+    return sums, counts
 
 def cum3x_pcs (x, maxlag=0, nsamp=1, overlap=0, k1=0):
     """
-    CUM3X Third-order cross-cumulants.
-        x,y,z  - data vectors/matrices with identical dimensions
-                 if x,y,z are matrices, rather than vectors, columns are
-                 assumed to correspond to independent realizations,
-                 overlap is set to 0, and samp_seg to the row dimension.
+    CUM3X Third-order self-cumulants of the nested-sampled signal.
+        x - data vector
         maxlag - maximum lag to be computed    [default = 0]
         samp_seg - samples per segment  [default = data_length]
         overlap - percentage overlap of segments [default = 0]
                   overlap is clipped to the allowed range of [0,99].
-        flag : 'biased', biased estimates are computed  [default]
-               'unbiased', unbiased estimates are computed.
         k1: the fixed lag in c3(m,k1): defaults to 0
+            a list of lags returns one slice per row
     Return:
-        y_cum:  estimated third-order cross cumulant,
-                E x^*(n)y(n+m)z(n+k1),   -maxlag <= m <= maxlag
+        y_cum:  estimated third-order cumulant,
+                E x(n)x(n+m)x(n+k1),   -maxlag <= m <= maxlag
     """
     assert 0<=nsamp<=len(x), "The length of segment is illegal."
-    y = z = x
-
-    overlap = overlap/100*nsamp
-    nadvance = nsamp - overlap
-    nrecs  = (len(x)-overlap)/nadvance
-    nlags = 2*maxlag+1
-    y_cum = np.zeros(nlags, dtype=float)
-    count = np.zeros(nlags, dtype=float)
-
-    if k1 >= 0:
-        indx = range(nsamp-k1)
-        indz = range(k1, nsamp)
-    else:
-        indx = range(-k1, nsamp)
-        indz = range(nsamp+k1)
-    ind = 0
     # in current settings, the input pcs has already been zero-mean, and is real signal
-    for k in range(nrecs):
-        xs = x[ind:(ind+nsamp)]
-        ys = y[ind:(ind+nsamp)]
-        zs = z[ind:(ind+nsamp)]
-
-        u = np.zeros(nsamp, dtype=float)
-        u[indx[0]:indx[-1]+1] = xs[indx]*zs[indz]
-
-        temp = u*ys
-        y_cum[maxlag] += reduce(lambda m,n:m+n,temp, 0)
-        count[maxlag] += sum(1 for i in temp if i!=0)
-        for m in range(1,maxlag+1):
-            temp = u[m:nsamp]*ys[:nsamp-m]
-            y_cum[maxlag-m] = y_cum[maxlag-m]+reduce(lambda i,j:i+j,temp, 0)
-            count[maxlag-m] += sum(1 for i in temp if i!=0)
-            temp = u[:nsamp-m]*ys[m:nsamp]
-            y_cum[maxlag+m] = y_cum[maxlag+m]+reduce(lambda i,j:i+j,temp, 0)
-            count[maxlag+m] += sum(1 for i in temp if i!=0)
-        ind += nadvance
-    return y_cum/count
+    klist = np.atleast_1d(k1)
+    lags = [(k, m) for k in klist for m in range(-maxlag, maxlag+1)]
+    sums, counts = cum3_self(segments(x, nsamp, overlap), lags)
+    y_cum = np.reshape(np.sum(sums, 0)/np.sum(counts, 0), (len(klist), 2*maxlag+1))
+    if np.ndim(k1) == 0:
+        return y_cum[0]
+    return y_cum
+
+def cum4_self (xs, maxlag, k1=0, k2=0):
+    """
+    Per-segment fourth-order self-cumulants of the segments xs.
+    The three second-order corrections all come from one symmetric
+    auto-covariance per segment, evaluated for the non-negative lags only.
+    Return: (nrecs, 2*maxlag+1); cum4x_pcs is their mean.
+    """
+    nrecs, nsamp = xs.shape
+    mlag = maxlag + max(abs(k1), abs(k2), abs(k1-k2))
+
+    # x(n)x(n+k1)x(n+k2) over the samples where all three are available
+    lo = -min(0, k1, k2)
+    hi = nsamp - max(0, k1, k2)
+    ziv = np.zeros(xs.shape)
+    ziv[:, lo:hi] = xs[:, lo:hi]*xs[:, lo+k1:hi+k1]*xs[:, lo+k2:hi+k2]
+
+    tmp = np.zeros((nrecs, 2*maxlag+1))
+    count = np.zeros((nrecs, 2*maxlag+1))
+    for m in range(-maxlag, maxlag+1):
+        if m >= 0:
+            temp = ziv[:, :nsamp-m]*xs[:, m:]
+        else:
+            temp = ziv[:, -m:]*xs[:, :nsamp+m]
+        tmp[:, maxlag+m] = np.sum(temp, 1)
+        count[:, maxlag+m] = np.sum(temp != 0, 1)
+    y_cum = np.where(count != 0, tmp/np.maximum(count, 1), 0)
+
+    # raw lag products R(k1), R(k2), R(k1-k2) of every segment
+    sums, counts = cum2_self(xs, mlag)
+    # centered auto-covariance of every segment, C2(-mlag)..C2(mlag)
+    rsums, rcounts = cum2_self(centering(xs), mlag)
+    R = mirror(rsums/rcounts)
+    m = mlag + np.arange(-maxlag, maxlag+1)
+
+    return y_cum - (sums[:, abs(k1-k2)]/counts[:, abs(k1-k2)])[:, np.newaxis]*R[:, m] \
+            - (sums[:, abs(k1)]/counts[:, abs(k1)])[:, np.newaxis]*R[:, m-k2] \
+            - (sums[:, abs(k2)]/counts[:, abs(k2)])[:, np.newaxis]*R[:, m-k1]
 
-# in this algo. (w, y, z) have the same priority, rotating them will not
-# affact the final results. In contrast, x has higher priority.
 def cum4x_pcs (w, maxlag=0, nsamp=1, overlap=0, k1=0, k2=0):
     """
-    CUM4EST Fourth-order cumulants.
+    CUM4EST Fourth-order self-cumulants of the nested-sampled signal.
            Computes sample estimates of fourth-order cumulants
            via the overlapped segment method.
-    
-           y_cum = cum4est (y, maxlag, samp_seg, overlap, flag, k1, k2)
-           y: input data vector (column)
+           w: input data vector
            maxlag: maximum lag
            samp_seg: samples per segment
            overlap: percentage overlap of segments
-           flag : 'biased', biased estimates are computed     (DISABLED)
-                  'unbiased', unbiased estimates are computed.
-           k1,k2 : the fixed lags in C3(m,k1) or C4(m,k1,k2); see below
+           k1,k2 : the fixed lags in C4(m,k1,k2)
            y_cum : estimated fourth-order cumulant slice
                   C4(m,k1,k2)  -maxlag <= m <= maxlag
     """
-    x = y = z = w
-    length = len(x)
-    assert length==len(y)==len(z)==len(w), "The four input signals should have same length!"
+    length = len(w)
     assert maxlag>=0, "maxlag should be nonnegative!"
     assert 0<nsamp<=length, "The segmentation setting is illegal!"
-
-    overlap0 = overlap
-    overlap = overlap/100*nsamp
-    nadvance = nsamp - overlap
-    nrecs = (length-overlap)/nadvance
-    nlags = 2 * maxlag +1
-
-    y_cum = np.zeros(nlags, dtype=float)
-    rind = -np.array(range(-maxlag, maxlag+1))
-    ind = 0
-    for i in range(nrecs):
-        count = np.zeros(nlags, dtype=float)
-        tmp = y_cum * 0
-        R_zy = R_wy = M_wz = 0
-
-        ws = w[ind:(ind+nsamp)]
-        xs = x[ind:(ind+nsamp)]
-        zs = z[ind:(ind+nsamp)]
-        cys = ys = y[ind:(ind+nsamp)]
-        ziv = xs*0
-
-        if k1 >= 0:
-            ziv[:nsamp-k1] = ws[:nsamp-k1]*cys[k1:nsamp]
-            temp = ws[:nsamp-k1]*ys[k1:nsamp]
-            R_wy += sum(temp)
-            sc1 = sum(1 for m in temp if m!=0)
-        else:
-            ziv[-k1:nsamp] = ws[-k1:nsamp]*cys[:nsamp+k1]
-            temp = ws[-k1:nsamp]*ys[:nsamp+k1]
-            R_wy += sum(temp)
-            sc1 = sum(1 for m in temp if m!=0)
-        if k2 >= 0:
-            ziv[:nsamp-k2] = ziv[:nsamp-k2] * zs[k2:nsamp]
-            if len(z.shape) == 1:
-                ziv[nsamp-k2:nsamp] = np.zeros(k2)
-            else:
-                ziv[nsamp-k2:nsamp] = np.zeros((k2, z.shape[1]))
-            temp = ws[:nsamp-k2]*zs[k2:nsamp]
-            M_wz += sum(temp)
-            sc2 = sum(1 for m in temp if m!=0)
-        else:
-            ziv[-k2:nsamp] = ziv[-k2:nsamp] * zs[:nsamp+k2]
-            ziv[:-k2] = np.zeros[-k2]
-            temp = ws[-k2:nsamp]*zs[:nsamp-k2]
-            M_wz += sum(temp)
-            sc2 = sum(1 for m in temp if m!=0)
-        if k1-k2 >= 0:
-            temp = zs[:nsamp-k1+k2]*ys[k1-k2:nsamp]
-            R_zy += sum(temp)
-            sc12 = sum(1 for m in temp if m!=0)
-        else:
-            temp = zs[-k1+k2:nsamp]*ys[:nsamp-k2+k1]
-            R_zy += sum(temp)
-            sc12 = sum(1 for m in temp if m!=0)
-        
-        temp = ziv*xs
-        tmp[maxlag] += sum(temp)
-        count[maxlag] += sum(1 for m in temp if m!=0)
-        for k in range(1, maxlag+1):
-            temp = ziv[k:nsamp]*xs[:nsamp-k]
-            tmp[maxlag-k] += sum(temp)
-            count[maxlag-k] += sum(1 for m in temp if m!=0)
-            temp = ziv[:nsamp-k]*xs[k:nsamp]
-            tmp[maxlag+k] += sum(temp)
-            count[maxlag+k] += sum(1 for m in temp if m!=0)
-        
-        y_cum += [tmp[m]/count[m] if count[m]!=0 else 0 for m in range(len(count))]
-        R_wx = cum2x(ws, xs, maxlag, nsamp, overlap0)
-        R_zx = cum2x(zs, xs, maxlag+abs(k2), nsamp, overlap0)
-        M_yx = cum2x(cys, xs, maxlag+abs(k1), nsamp, overlap0)
-
-        y_cum = y_cum - R_zy*R_wx/sc12 - R_wy*R_zx[-k2+abs(k2):2*maxlag-k2+abs(k2)+1] /sc1 \
-                - M_wz*M_yx[-k1+abs(k1):2*maxlag-k1+abs(k1)+1]/sc2
-        ind += nadvance
-
-    return y_cum/nrecs
+    return np.mean(cum4_self(segments(w, nsamp, overlap), maxlag, k1, k2), 0)
 
 
 def cum3x (x, y, z, maxlag=0, nsamp=1, overlap=0, k1=0):
@@ -437,41 +383,129 @@ def test ():
     print cum4x(sampling(y,nsamp,2), sampling(y,nsamp,3), sampling(y,nsamp,5), sampling(y,nsamp,7), 2, 512, 0, 0, 0)
 
 
+def nested_pattern(y, n1, n2):
+    """
+    Return the index of the block chosen in every window by the nested smoothing.
+    y should hold a whole number of windows of (n1+1)*n2 samples.
+    """
+    win = (n1+1)*n2
+    step = len(y)/win
+    blocks = np.reshape(y, (step, n2, n1+1))
+    overall = np.var(np.reshape(blocks, (step, win)), 1)
+    # replicating a block over the window keeps the variance of the block
+    estimate = np.var(blocks, 2)
+    return np.argmin(abs(overall[:, np.newaxis]-estimate), 1)
+
 def nested_smoothing(y, nested_list):
-    # preprocessing for the nested sampling
+    """
+    Preprocessing for the nested sampling.
+    Every window of (n1+1)*n2 samples is split into n2 blocks of n1+1 samples.
+    The window is replaced by the block which, replicated over the window,
+    keeps the variance closest to the one of the original window.
+    All windows are processed at once; the input signal is not modified.
+    """
     n1 = nested_list[0]
     n2 = nested_list[1]
     win = (n1+1)*n2
     step = len(y)/win
-    for i in range(step):
-        pt = 0
-        minimum = maxint
-        cache = np.zeros((n2, win))
-        overall = np.var(y[i*win:(i+1)*win])
-        for j in range(n2):
-            # TODO: check if added np.array() changing anything
-            cache[j] = y[i*win:(i+1)*win]
-            for k in range(n2):
-                if j==k: continue
-                cache[j][k*(n1+1):(k+1)*(n1+1)] = cache[j][j*(n1+1):(j+1)*(n1+1)]
-            estimate = np.var(cache[j])
-            if abs(overall-estimate)<minimum:
-                minimum = overall-estimate
-                pt = j
-        y[i*win:(i+1)*win] = cache[pt]
-    # done preprossing
+    y = np.array(y, dtype=float)
+    pt = nested_pattern(y[:step*win], n1, n2)
+    chosen = np.reshape(y[:step*win], (step, n2, n1+1))[np.arange(step), pt]
+    y[:step*win] = np.tile(chosen[:, np.newaxis, :], (1, n2, 1)).flatten()
     return y
 
+class NestedScheme(object):
+    """
+    Precomputed multilevel nested sampling for signals of a given length.
+        nested_list - the nested factors, e.g. [4,3,4]
+        length - length of the signals the scheme is applied to
+    Every level [n1, n2] of nested_list replaces each window of (n1+1)*n2 samples
+    by one of its n2 blocks. The candidate index tables of all levels are built
+    once, the levels are composed as index maps, and apply() gathers the signal
+    only once. The result is the same as multilevel_nest().
+        lags - source lags realized between the samples of one window of the
+               last level, i.e. the coarray lag coverage of the scheme
+    """
+    def __init__(self, nested_list, length):
+        assert len(nested_list)>=2, "There is not sufficient nested factors!"
+        self.nested_list = list(nested_list)
+        self.length = length
+        self.levels = []
+        for i in range(len(nested_list)-1):
+            n1 = nested_list[i]
+            n2 = nested_list[i+1]
+            win = (n1+1)*n2
+            step = length/win
+            # offset[j,t]: position in the window copied to t if block j is chosen
+            offset = np.arange(n2)[:, np.newaxis]*(n1+1) + np.arange(win)%(n1+1)
+            start = (np.arange(step)*win)[:, np.newaxis]
+            self.levels.append((n1, n2, win, step, offset, start))
+
+        src = np.arange(length)
+        for n1, n2, win, step, offset, start in self.levels:
+            src[:step*win] = src[start + offset[np.zeros(step, dtype=int)]].flatten()
+        src = src[:self.levels[-1][2]]
+        self.lags = np.unique(abs(src[:, np.newaxis]-src[np.newaxis, :]))
+
+    def __len__(self):
+        return len(self.nested_list)
+
+    def apply(self, y):
+        """Return the nested-sampled copy of y."""
+        assert len(y) == self.length, "The signal length does not match the scheme!"
+        y = np.asarray(y, dtype=float)
+        src = np.arange(self.length)
+        for n1, n2, win, step, offset, start in self.levels:
+            pt = nested_pattern(y[src[:step*win]], n1, n2)
+            src[:step*win] = src[start + offset[pt]].flatten()
+        return y[src]
+
 def multilevel_nest(y, nested_list):
-    iteration = len(nested_list)-1
-    for i in range(iteration):
-        y = nested_smoothing(y, nested_list[i:(i+2)])
-    return y
+    if not isinstance(nested_list, NestedScheme):
+        nested_list = NestedScheme(nested_list, len(y))
+    return nested_list.apply(y)
+
+def cumx_segments (y, nested_list, lags, maxlag=0, nsamp=0, overlap=0):
+    """
+    Per-segment contributions of several nested cumulant slices.
+    The signal is nested-sampled and segmented once for all the slices.
+         lags - list of (norder, k1, k2), one entry per slice
+         maxlag, nsamp, overlap - as in cumx
+         Return: list of (sums, counts), each (nrecs, 1, 2*maxlag+1),
+                 such that cum2x.pooled(sums, counts) equals the cumx slice.
+    """
+    assert maxlag>0, "maxlag must be non-negative!"
+    assert nsamp>=0 and nsamp<len(y), "The number of samples is illigal!"
+    if nsamp == 0: nsamp = len(y)
+    for norder, k1, k2 in lags:
+        if norder not in (2, 3, 4):
+            raise Exception("Cumulant order must be 2, 3, or 4!")
+        assert len(nested_list)>=norder, "There is not sufficient PCS coefficients!"
+
+    xs = segments(multilevel_nest(y, nested_list), nsamp, overlap)
+    third = [(k1, m) for norder, k1, k2 in lags if norder == 3 for m in range(-maxlag, maxlag+1)]
+    if third:
+        sums3, counts3 = cum3_self(xs, third)
+
+    result = []
+    for norder, k1, k2 in lags:
+        if norder == 2:
+            sums, counts = cum2_self(centering(xs), maxlag)
+            sums, counts = mirror(sums), mirror(counts)
+        elif norder == 3:
+            sums, counts = sums3[:, :2*maxlag+1], counts3[:, :2*maxlag+1]
+            sums3, counts3 = sums3[:, 2*maxlag+1:], counts3[:, 2*maxlag+1:]
+        else:
+            sums = cum4_self(xs, maxlag, k1, k2)
+            counts = np.ones(sums.shape)
+        result.append((sums[:, np.newaxis, :], counts[:, np.newaxis, :]))
+    return result
 
 def cumx (y, nested_list, norder=2,maxlag=0,nsamp=0,overlap=0,k1=0,k2=0):
     """
     CUMEST Second-, third- or fourth-order cumulants.
          y - time-series  - should be a vector
+         nested_list - nested factors, or a NestedScheme built for len(y)
          norder - cumulant order: 2, 3 or 4 [default = 2]
          maxlag - maximum cumulant lag to compute [default = 0]
          nsamp - samples per segment  [default = data_length]
@@ -482,28 +516,9 @@ def cumx (y, nested_list, norder=2,maxlag=0,nsamp=0,overlap=0,k1=0,k2=0):
          y_cum  - C2(m) or C3(m,k1) or C4(m,k1,k2),  -maxlag <= m <= maxlag
                   depending upon the cumulant order selected
     """
-    assert maxlag>0, "maxlag must be non-negative!"
-    assert nsamp>=0 and nsamp<len(y), "The number of samples is illigal!"
-    if nsamp == 0: nsamp = len(y)
-    result = []
-
-    y = multilevel_nest(y, nested_list)
+    sums, counts = cumx_segments(y, nested_list, [(norder, k1, k2)], maxlag, nsamp, overlap)[0]
+    return pooled(sums, counts)
 
-    if norder == 2:
-        assert len(nested_list)>=2, "There is not sufficient PCS coefficients!"
-        return cum2x (y, maxlag, nsamp, overlap)
-    elif norder == 3:
-        assert len(nested_list)>=3, "There is not sufficient PCS coefficients!"
-        return cum3x_pcs(y, maxlag, nsamp, overlap, k1)
-    elif norder == 4:
-        assert len(neste_list)>=4, "There is not sufficient PCS coefficients!"
-        return cum4x_pcx(y, maxlag, nsamp, overlap, k1, k2)
-
-    else:
-        raise Exception("Cumulant order must be 2, 3, or 4!")
-    
 
 if __name__=="__main__":
     test()
-
-
@@ -1,6 +1,12 @@
 import numpy as np
-from scipy.linalg import toeplitz, lstsq
-from nested_cumxst import cumx
+from maest import CumulantContext, ma_lags, solve_batch, sweep_lags, order_sweep
+from nested_cumxst import cumx, cumx_segments
+
+def contextx(y, pcs, q, norder=3, samp_seg=1, overlap=0):
+    """CumulantContext of maestx, see maestx for the parameters."""
+    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
+    overlap = max(0, min(overlap,99))
+    return CumulantContext(cumx_segments(y, pcs, ma_lags(q, norder), q, samp_seg, overlap), q, norder)
 
 def maestx(y, pcs, q, norder=3,samp_seg=1,overlap=0):
     """
@@ -14,49 +20,28 @@ def maestx(y, pcs, q, norder=3,samp_seg=1,overlap=0):
         flag - 'biased' or 'unbiased'          [default = 'biased']
         Return: estimated MA parameter vector
     """
-    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
-    nsamp = len(y)
-    overlap = max(0, min(overlap,99))
-
-    c2 = cumx(y, pcs, 2,q, samp_seg, overlap)
-    c2 = np.hstack((c2, np.zeros(q)))
-    cumd = cumx(y, pcs, norder,q,samp_seg,overlap,0,0)[::-1]
-    cumq = cumx(y, pcs, norder,q,samp_seg,overlap,q,q)
-    cumd = np.hstack((cumd, np.zeros(q)))
-    cumq[:q] = np.zeros(q)
+    return contextx(y, pcs, q, norder, samp_seg, overlap).solve()
 
-    cmat = toeplitz(cumd, np.hstack((cumd[0],np.zeros(q))))
-    rmat = toeplitz(c2,   np.hstack((c2[0],np.zeros(q))))
-    amat0 = np.hstack((cmat, -rmat[:,1:q+1]))
-    rvec0 = c2
-
-    cumq = np.hstack((cumq[2*q:q-1:-1], np.zeros(q)))
-    cmat4 = toeplitz(cumq, np.hstack((cumq[0],np.zeros(q))))
-    c3   = cumd[:2*q+1]
-    amat0 = np.vstack((np.hstack((amat0, np.zeros((3*q+1,1)))), \
-            np.hstack((np.hstack((np.zeros((2*q+1,q+1)), cmat4[:,1:q+1])), \
-            np.reshape(-c3,(len(c3),1))))))
-    rvec0 = np.hstack((rvec0, -cmat4[:,0]))
+def maestx_batch(ys, pcs, q, norder=3, samp_seg=1, overlap=0, solver='dense'):
+    """
+    maestx over a stack of Monte Carlo realizations.
+        ys - (R, N) array or list of R time-series
+        solver - 'dense' or 'normal', see maest.gmrcls_batch  [default = 'dense']
+        other parameters as in maestx
+        Return: (R, q+1) estimated MA parameter vectors, one row per realization
+    """
+    return solve_batch([contextx(y, pcs, q, norder, samp_seg, overlap) for y in ys], solver)
 
-    row_sel = range(q)+range(2*q+1,3*q+1)+range(3*q+1,4*q+1)+range(4*q+2,5*q+2)
-    amat0 = amat0[row_sel,:]
-    rvec0 = rvec0[row_sel]
+def maestx_bootstrap(y, pcs, q, norder=3, samp_seg=1, overlap=0, nboot=200, alpha=0.05, seed=None):
+    """maestx with segment-bootstrap percentile intervals, see maest.CumulantContext.bootstrap."""
+    return contextx(y, pcs, q, norder, samp_seg, overlap).bootstrap(nboot, alpha, seed)
 
-    bvec = lstsq(amat0, rvec0)[0]
-    b1 = bvec[1:q+1]/bvec[0]
-    b2 = bvec[q+1:2*q+1]
-    if norder == 3:
-        if all(b2 > 0):
-            b1 = np.sign(b1) * np.sqrt(0.5*(b1**2 + b2))
-        else:
-            print 'MAEST: alternative solution b1 used'
-    else:
-        b1 = np.sign(b2)* (abs(b1) + abs(b2)**(1./3))/2
-#        if all(np.sign(b2) == np.sign(b1)):
-#            b1 = np.sign(b1)* (abs(b1) + abs(b2)**(1./3))/2
-#        else:
-#            print 'MAEST: alternative solution b1 used'
-    return np.hstack(([1], b1))
+def maestx_sweep(y, pcs, q_max, norder=3, samp_seg=1, overlap=0):
+    """maestx for every MA order up to q_max, see maest.order_sweep."""
+    assert norder>=2 and norder<=4, "Cumulant order must be 2, 3, or 4!"
+    overlap = max(0, min(overlap,99))
+    return order_sweep(cumx_segments(y, pcs, sweep_lags(q_max, norder), q_max, samp_seg, overlap), \
+            q_max, norder)
 
 def test():
     import scipy.io as sio
@@ -69,7 +54,3 @@ def test():
 
 if __name__=="__main__":
     test()
-
-
-
-
@@ -0,0 +1,185 @@
+"""
+Noisy Monte Carlo realizations regenerated in memory instead of read from the
+files of multiprocessing/data_generate. A realization is identified by
+(kind, channel taps, noise taps, snr, noise_type, run index); the noise is drawn
+from a RNG seeded with that key, so the same key always gives the same record,
+in any process and in any order. In the shared-noise mode (records with shared=True)
+the snr is left out of the key: every snr adds the same unit noise, scaled, to the
+same signal, as cumx_snr and cumest_snr require.
+    kind - 'ma', 'ar' or 'arma', the channels of data_generate
+    sig_tap, noise_tap - taps of the signal channel and of the color noise filter;
+                         for 'arma' each is the pair (ar taps, ma taps)
+    snr - in dB, larger than 100 for the noise-free record
+    noise_type - 'white' or 'color'
+"""
+import os
+import zlib
+import tempfile
+import numpy as np
+from math import sqrt
+from scipy.signal import lfilter
+
+# the exponential deviates driving the channel: None regenerates them block by block
+# (deviates), or a file template such as "/home/creasy/workplace/data/exp_deviate_one_%d.npy"
+BASE = None
+# the deviates of a run come in blocks of their own RNG, 709632 = 128 blocks, one 4-PCS segment each
+BLOCK = 5544
+SEED = 709632
+# the base signals mapped once for all the workers of a pool, and the BASE they came from, see share
+SHARED = None
+SOURCE = None
+# the rows of noise synthesized together by records
+CHUNK = 16
+
+def channel(kind, sig_tap, noise_tap):
+    """
+    Return ((b, a) of the signal channel, (b, a) of the color noise filter,
+    signal power, noise power), the powers setting the noise scale as in data_generate.
+    """
+    if kind == 'ma':
+        return (sig_tap, [1]), (noise_tap, [1]), sum(sig_tap)**2, sum(noise_tap)**2
+    elif kind == 'ar':
+        return ([1], sig_tap), ([1], noise_tap), sum(sig_tap)**2, sum(noise_tap)**2
+    elif kind == 'arma':
+        return (sig_tap[1], sig_tap[0]), (noise_tap[1], noise_tap[0]), \
+                (sum(sig_tap[0])+sum(sig_tap[1]))**2, (sum(noise_tap[0])+sum(noise_tap[1]))**2
+    raise Exception("The channel should be 'ma', 'ar' or 'arma'!")
+
+def taps(tap):
+    """Taps (or a pair of taps) as nested tuples of floats, so that equal taps give equal keys."""
+    return tuple(taps(k) if isinstance(k, (list, tuple, np.ndarray)) else float(k) for k in tap)
+
+def seed(kind, sig_tap, noise_tap, snr, noise_type, i):
+    """The seed of the noise of a realization, stable across processes and runs; snr None for the shared noise."""
+    key = repr((kind, taps(sig_tap), taps(noise_tap), snr, noise_type))
+    return [zlib.crc32(key) & 0xffffffff, i]
+
+def deviate_block(i, b, beta=1., block=BLOCK):
+    """Block b of the centered exponential deviates of run i, from a RNG seeded with (SEED, i, b)."""
+    rng = np.random.RandomState([SEED, i, b])
+    return rng.exponential(beta, block) - beta
+
+def deviates(i, start, stop, beta=1., block=BLOCK):
+    """
+    Samples start..stop-1 of the centered exponential deviates of run i.
+    Only the blocks holding them are generated, so any segment of any run can be
+    produced on its own, in any process, without the earlier blocks.
+    """
+    if stop <= start:
+        return np.zeros(0)
+    first = start/block
+    temp = np.hstack([deviate_block(i, b, beta, block) for b in range(first, (stop-1)/block+1)])
+    return temp[start-first*block:stop-first*block]
+
+def share(runs, length, directory=None):
+    """
+    Load or generate the base signals of runs 0..runs-1 once, into a read-only
+    memory map of a (runs, length) .npy file, from which base then returns views.
+    Call it before creating the Pool: the forked workers inherit the map, so they
+    all read the same pages without copies or file reads, whatever their number.
+    The file is unlinked at once, its pages live as long as the map.
+        directory - where the file is written  [default: the temporary directory]
+        Return: the map
+    """
+    global SHARED, SOURCE
+    unshare()
+    fd, filename = tempfile.mkstemp(".npy", "base_", directory)
+    os.close(fd)
+    try:
+        temp = np.lib.format.open_memmap(filename, 'w+', float, (runs, length))
+        for i in range(runs):
+            temp[i] = base(i, length)
+        temp.flush()
+        del temp
+        SHARED = np.load(filename, mmap_mode='r')
+        SOURCE = BASE
+    finally:
+        os.remove(filename)
+    return SHARED
+
+def unshare():
+    """Drop the map of share, base reads or generates the signals again."""
+    global SHARED, SOURCE
+    SHARED = None
+    SOURCE = None
+
+def base(i, length):
+    """
+    The first length samples of the exponential deviates of run i,
+    from the map of share when it holds them and BASE has not changed since.
+    """
+    if SHARED is not None and SOURCE == BASE and i < SHARED.shape[0] and length <= SHARED.shape[1]:
+        return SHARED[i, :length]
+    if BASE is None:
+        return deviates(i, 0, length)
+    return np.load(BASE%(i), mmap_mode='r')[:length]
+
+def amplitudes(kind, sig_tap, noise_tap, snrs, noise_type):
+    """The amplitude of the unit noise of unit_noise at every snr in snrs, 0 for the noise-free snr > 100."""
+    (b, a), (nb, na), sig_power, noise_power = channel(kind, sig_tap, noise_tap)
+    snrs = np.asarray(snrs, dtype=float)
+    scale = np.where(snrs > 100, 0., np.sqrt(sig_power/10**(np.minimum(snrs, 100)/10.)))
+    if noise_type == "color":
+        scale = scale/sqrt(noise_power)
+    return scale
+
+def unit_noise(kind, sig_tap, noise_tap, snrs, noise_type, i, length):
+    """
+    The unit noise of run i at every snr in snrs, one row each drawn from its seeded
+    RNG, filtered by one lfilter along the rows for color noise. The snr None
+    draws the noise shared by all the snrs.
+    """
+    (b, a), (nb, na), sig_power, noise_power = channel(kind, sig_tap, noise_tap)
+    noise = np.array([np.random.RandomState(seed(kind, sig_tap, noise_tap, snr, noise_type, i)) \
+            .standard_normal(length) for snr in snrs]).reshape(len(snrs), length)
+    if noise_type == "color":
+        noise = lfilter(nb, na, noise, axis=1)
+    return noise
+
+def shared_noise(kind, sig_tap, noise_tap, noise_type, i, length):
+    """
+    The (2, length) stack of the noise-free record of run i and of its shared unit noise:
+    the row of records(..., shared=True) at snr is the first row plus
+    amplitudes(..., [snr], ...) times the second.
+    """
+    (b, a), (nb, na), sig_power, noise_power = channel(kind, sig_tap, noise_tap)
+    return np.vstack((lfilter(b, a, base(i, length)), unit_noise(kind, sig_tap, noise_tap, [None], noise_type, i, length)))
+
+def records(kind, sig_tap, noise_tap, snrs, noise_type, i, length, dtype=float, shared=False):
+    """
+    The first length samples of the realizations of run i at every snr in snrs,
+    as a (len(snrs), length) matrix: the deviates of run i through the channel,
+    plus white or color noise at every snr.
+    The channel is filtered once; the unit noise of every snr is drawn from its
+    seeded RNG, filtered by one lfilter along the rows, and scaled by the vector
+    of noise amplitudes, CHUNK rows at a time, so the float64 temporaries hold
+    CHUNK rows whatever the number of snrs. The noise is drawn sample by sample,
+    so a shorter record is a prefix of a longer one.
+        dtype - type of the matrix, np.float32 halves the footprint  [default = float]
+        shared - add the same unit noise at every snr, see shared_noise  [default = False]
+    """
+    if noise_type not in ("white", "color"):
+        raise Exception("ERROR: the noise type is wrong!!")
+    (b, a), (nb, na), sig_power, noise_power = channel(kind, sig_tap, noise_tap)
+    receive = lfilter(b, a, base(i, length))
+    result = np.empty((len(snrs), length), dtype=dtype)
+    result[:] = receive
+    noisy = [k for k in range(len(snrs)) if snrs[k] <= 100]
+    if shared and noisy:
+        noise = unit_noise(kind, sig_tap, noise_tap, [None], noise_type, i, length)
+
+    for k0 in range(0, len(noisy), CHUNK):
+        rows = noisy[k0:k0+CHUNK]
+        scale = amplitudes(kind, sig_tap, noise_tap, [snrs[k] for k in rows], noise_type)
+        if not shared:
+            noise = unit_noise(kind, sig_tap, noise_tap, [snrs[k] for k in rows], noise_type, i, length)
+        temp = scale[:, np.newaxis]*noise
+        temp += receive
+        result[rows] = temp
+    return result
+
+def record(kind, sig_tap, noise_tap, snr, noise_type, i, length):
+    """
+    The first length samples of the realization at the given snr, a row of records.
+    """
+    return records(kind, sig_tap, noise_tap, [snr], noise_type, i, length)[0]
@@ -0,0 +1,112 @@
+"""
+Append-only binary store of sweep results, one file per sweep.
+A record is a key, the dictionary of the sweep parameters of a cell (see sweep.cells)
+plus the index of the output, and a float64 array holding one row per realization.
+Every record is a small header (key length, number of dimensions, shape), the key
+as text and the raw little-endian float64 data, so the records are read back as
+NumPy arrays straight from the bytes of the file, without any parsing.
+Every append writes its records under an exclusive lock, so several processes
+may append to the same file, after cutting off a record torn by a crash so that
+the new records follow the last complete one.
+"""
+import os
+import fcntl
+import struct
+from ast import literal_eval
+import numpy as np
+from collections import OrderedDict
+
+MAGIC = "HOPR"
+HEADER = struct.Struct("<4sII")
+
+def key(cell):
+    """The text identifying a record: the sorted items of the cell."""
+    return repr(sorted(cell.items()))
+
+def append(filename, records):
+    """
+    Append records to the store.
+        records - list of (cell, value), value being an array or a list of
+                  equally long arrays, one per realization
+    """
+    chunks = []
+    for cell, value in records:
+        text = key(cell)
+        value = np.asarray(value, dtype='<f8')
+        chunks += [HEADER.pack(MAGIC, len(text), value.ndim), struct.pack("<%dQ"%(value.ndim), *value.shape), \
+                text, value.tobytes()]
+    data = ''.join(chunks)
+    fd = os.open(filename, os.O_RDWR|os.O_CREAT, 0644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        start = end(fd, filename)
+        os.ftruncate(fd, start)
+        os.lseek(fd, start, os.SEEK_SET)
+        written = 0
+        while written < len(data):
+            written += os.write(fd, buffer(data, written))
+    finally:
+        os.close(fd)
+
+def end(fd, filename):
+    """The offset just past the last complete record of the open store, reading only the headers."""
+    size = os.fstat(fd).st_size
+    start = 0
+    while start + HEADER.size <= size:
+        os.lseek(fd, start, os.SEEK_SET)
+        magic, length, ndim = HEADER.unpack(os.read(fd, HEADER.size))
+        if magic != MAGIC:
+            raise Exception("%s is not a result store, or is corrupted at byte %d!"%(filename, start))
+        if start + HEADER.size + 8*ndim > size:
+            break
+        shape = struct.unpack("<%dQ"%(ndim), os.read(fd, 8*ndim))
+        stop = start + HEADER.size + 8*ndim + length + 8*int(np.prod(shape))
+        if stop > size:
+            break
+        start = stop
+    return start
+
+def records(filename):
+    """
+    Generator of the (cell, array) records in the order they were appended,
+    the arrays being read-only views of the bytes of the file.
+    A record cut short by a crash at the end of the file is skipped.
+    """
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'rb') as f:
+        data = f.read()
+    start = 0
+    while start + HEADER.size <= len(data):
+        magic, length, ndim = HEADER.unpack_from(data, start)
+        if magic != MAGIC:
+            raise Exception("%s is not a result store, or is corrupted at byte %d!"%(filename, start))
+        start += HEADER.size
+        if start + 8*ndim > len(data):
+            return
+        shape = struct.unpack_from("<%dQ"%(ndim), data, start)
+        start += 8*ndim
+        text = data[start:start+length]
+        start += length
+        size = 8*int(np.prod(shape))
+        if start + size > len(data):
+            return
+        yield dict(literal_eval(text)), np.frombuffer(data, '<f8', size/8, start).reshape(shape)
+        start += size
+
+def keys(filename):
+    """The keys of the records in the store."""
+    return set(key(cell) for cell, value in records(filename))
+
+def load(filename, **where):
+    """
+    Load the records whose cell matches every parameter given in where,
+    e.g. load("result/test_order.npys", estimator='cx', snr=10).
+    A cell appended several times (a re-run) keeps its last record.
+        Return: list of (cell, array) in the order the cells were first appended
+    """
+    result = OrderedDict()
+    for cell, value in records(filename):
+        if all(cell.get(k) == v for k, v in where.items()):
+            result[key(cell)] = (cell, value)
+    return result.values()
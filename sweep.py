@@ -0,0 +1,378 @@
+"""
+Declarative, resumable runner of the Monte Carlo sweeps.
+A sweep is a grid spec: a dictionary of parameter -> list of values, e.g.
+    {'estimator': 'cx', 'pcs': [[1,2,3], [1,1,2,3]], 'order': 6, 'winsize': 512,
+     'slicing': range(5000,50001,5000), 'snr': range(-10,21), 'noise_type': ['white', 'color'],
+     'realizations': 50}
+With a 'channel' entry, e.g. 'channel': [('ma', [1, 0.9, 0.385, -0.771], [1, -2.33, 0.75, 0.5, 0.3, -1.41])],
+the realizations are regenerated in memory by realization.record instead of read from the data files,
+and the result file names are tagged with the channel, see channel_tag. The 'cx_snr' and
+'cm_snr' estimators take such a channel and an 'snrs' list instead of 'snr': one cell
+estimates every snr of the list from the shared-noise realizations (realization.shared_noise)
+with one cumx_snr or cumest_snr call per realization.
+Every combination is a cell. The cells differing only in slicing are run as one
+task of the pool when the estimator can evaluate all the prefixes in one pass,
+otherwise every cell is a task. The results of a cell are written by the main
+process once the cell is done, so that a crashed sweep only re-runs the cells
+without a result file. With a store file, the results are appended to that one
+binary file instead of the text files, see store.py.
+The estimations are cached on disk once cache.enable is called (or HOPCS_CACHE is
+set), so that a cell run again, by this or another sweep, is read back at once.
+"""
+import os
+import sys
+import time
+import traceback
+import resource
+import json
+import zlib
+from itertools import product
+from multiprocessing import Pool, cpu_count
+import numpy as np
+from collections import OrderedDict
+from cumxst import cumx, cumx_prefix, cumx_snr
+from cumest import cumest, cumest_prefix, cumest_snr
+from maest import maestx, maestx_sweep
+from realization import record, share, unshare, taps, shared_noise, amplitudes
+from cache import memoize
+import store as results_store
+
+# the estimators of the cells, cached on disk once the cache is enabled
+cumx = memoize(cumx)
+cumx_prefix = memoize(cumx_prefix)
+cumest = memoize(cumest)
+cumest_prefix = memoize(cumest_prefix)
+cumx_snr = memoize(cumx_snr)
+cumest_snr = memoize(cumest_snr)
+maestx = memoize(maestx)
+
+def estimate_cx(receive, cell):
+    return cumx(receive, cell['pcs'], len(cell['pcs']), cell['order'], cell['winsize'])
+
+def estimate_cm(receive, cell):
+    return cumest(receive, cell['hos'], cell['order'], cell['winsize'])
+
+def prefix_cx(receive, cell, lengths):
+    return cumx_prefix(receive, cell['pcs'], lengths, len(cell['pcs']), cell['order'], cell['winsize'])
+
+def prefix_cm(receive, cell, lengths):
+    return cumest_prefix(receive, lengths, cell['hos'], cell['order'], cell['winsize'])
+
+def snr_scales(cell):
+    kind, sig_tap, noise_tap = cell['channel']
+    return amplitudes(kind, sig_tap, noise_tap, cell['snrs'], cell['noise_type'])
+
+def estimate_cx_snr(receive, cell):
+    """cumx at every snr of the cell, one row per snr; receive is the stack of shared_noise."""
+    return cumx_snr(receive[0], receive[1], cell['pcs'], snr_scales(cell), len(cell['pcs']), cell['order'], \
+            cell['winsize'])
+
+def estimate_cm_snr(receive, cell):
+    """cumest at every snr of the cell, one row per snr; receive is the stack of shared_noise."""
+    return cumest_snr(receive[0], receive[1], snr_scales(cell), cell['hos'], cell['order'], cell['winsize'])
+
+def estimate_ma(receive, cell):
+    return maestx(receive, cell['pcs'], cell['order'], len(cell['pcs']), cell['winsize'])
+
+def estimate_ma_sweep(receive, cell):
+    """
+    The residual norm and the parameter vector of every MA order 1..q_max, one row
+    per order, the shorter parameter vectors padded with zeros.
+    """
+    taps, residual = maestx_sweep(receive, cell['pcs'], cell['q_max'], len(cell['pcs']), cell['winsize'])
+    result = np.zeros((cell['q_max'], cell['q_max']+2))
+    for q in range(cell['q_max']):
+        result[q, :len(taps[q])+1] = np.hstack((residual[q], taps[q]))
+    return result
+
+# the memoized arorder.ar_estimate, made at the first call: arorder and armaorder import this module
+ar_estimate = None
+
+def estimate_ar(receive, cell):
+    global ar_estimate
+    if ar_estimate is None:
+        from arorder import ar_estimate as function
+        ar_estimate = memoize(function)
+    return ar_estimate(receive, cell['pcs'], cell['ar'], cell['ma'], cell['winsize'])
+
+def estimate_ar_order(receive, cell):
+    """
+    ar, ma and the normalized singular values of every (ar, ma) hypothesis up to
+    (ar_max, ma_max), one row per hypothesis, the shorter spectra padded with zeros.
+    """
+    from arorder import order_spectra
+    spectra = order_spectra(receive, cell['pcs'], cell['ar_max'], cell['ma_max'], cell['winsize'])
+    result = np.zeros((len(spectra), cell['ar_max']+2))
+    for k, (ar, ma) in enumerate(sorted(spectra)):
+        result[k, :ar+2] = np.hstack((ar, ma, spectra[ar, ma]))
+    return result
+
+def estimate_arma(receive, cell):
+    from armaorder import arma_estimate
+    return arma_estimate(receive, cell['pcs'], cell['ar'], cell['ma'], cell['winsize'])
+
+# estimator: (function, prefix of the data files, names of the result files, one per output,
+#             function estimating all the slicing lengths at once or None)
+ESTIMATORS = {
+    'cx': (estimate_cx, "data",
+        ["cx_testorder%(order)s_hos%(npcs)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snr%(snr)d.csv"], prefix_cx),
+    'cm': (estimate_cm, "data",
+        ["cm_testorder%(order)s_hos%(hos)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snr%(snr)d.csv"], prefix_cm),
+    'cx_snr': (estimate_cx_snr, "data",
+        ["cxsnr_testorder%(order)s_hos%(npcs)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snrs%(snrname)s.csv"], None),
+    'cm_snr': (estimate_cm_snr, "data",
+        ["cmsnr_testorder%(order)s_hos%(hos)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snrs%(snrname)s.csv"], None),
+    'ma': (estimate_ma, "data",
+        ["ma_order%(order)s_hos%(npcs)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snr%(snr)d_pcs%(pcsname)s.csv"], None),
+    'ma_sweep': (estimate_ma_sweep, "data",
+        ["sweep_qmax%(q_max)d_hos%(npcs)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snr%(snr)d.csv"], None),
+    'ar': (estimate_ar, "ar_data",
+        ["ar_ar%(ar)sma%(ma)s_hos%(npcs)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snr%(snr)d_pcs%(pcsname)s.csv"], None),
+    'ar_order': (estimate_ar_order, "ar_data",
+        ["order_ar%(ar_max)sma%(ma_max)s_hos%(npcs)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snr%(snr)d_pcs%(pcsname)s.csv"], None),
+    'arma': (estimate_arma, "arma_data",
+        ["ar%(ar)s_hos%(npcs)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snr%(snr)d_pcs%(pcsname)s.csv",
+         "ma%(ma)s_hos%(npcs)d_winsize%(winsize)d_slice%(slicing)d%(noise)s_snr%(snr)d_pcs%(pcsname)s.csv"], None),
+}
+
+def data_file(prefix, cell, i):
+    """The i-th realization of the cell, snr > 100 stands for the noise-free data."""
+    if cell['snr'] > 100:
+        return "temp/%s_%d.npy"%(prefix, i)
+    return "temp/%s_%s_%d_%d.npy"%(prefix, cell['noise_type'], cell['snr'], i)
+
+def load(prefix, cell, i, length):
+    """The first length samples of the i-th realization of the cell; with snrs, the stack of shared_noise."""
+    if 'snrs' in cell:
+        kind, sig_tap, noise_tap = cell['channel']
+        return shared_noise(kind, sig_tap, noise_tap, cell['noise_type'], i, length)
+    if 'channel' in cell:
+        kind, sig_tap, noise_tap = cell['channel']
+        return record(kind, sig_tap, noise_tap, cell['snr'], cell['noise_type'], i, length)
+    return np.load(data_file(prefix, cell, i))[:length]
+
+def result_files(cell, directory="result"):
+    """The result files of the cell."""
+    fields = dict(cell)
+    if 'pcs' in cell:
+        fields['npcs'] = len(cell['pcs'])
+        fields['pcsname'] = ''.join([str(k) for k in cell['pcs']])
+    if 'snrs' in cell:
+        fields['snrname'] = '_'.join([str(k) for k in cell['snrs']])
+        fields['noise'] = "_%s"%(cell['noise_type'])
+    else:
+        fields['noise'] = "" if cell['snr'] > 100 else "_%s"%(cell['noise_type'])
+    names = [name%fields for name in ESTIMATORS[cell['estimator']][2]]
+    if 'channel' in cell:
+        names = [os.path.splitext(name)[0] + channel_tag(cell['channel']) + os.path.splitext(name)[1] \
+                for name in names]
+    return [os.path.join(directory, name) for name in names]
+
+def channel_tag(channel):
+    """The tag of a channel in the result file names: its kind and the crc32 of its taps."""
+    kind, sig_tap, noise_tap = channel
+    return "_%s%08x"%(kind, zlib.crc32(repr((taps(sig_tap), taps(noise_tap)))) & 0xffffffff)
+
+def axis(key, value):
+    """The values of one parameter of the spec; a single pcs or snrs is a list of numbers."""
+    if not isinstance(value, (list, tuple)):
+        return [value]
+    if key in ('pcs', 'snrs') and not isinstance(value[0], (list, tuple)):
+        return [value]
+    return value
+
+def cells(spec):
+    """
+    All the cells of a grid spec, each a dictionary of one value per parameter.
+    The noise-free cells (snr > 100) are not repeated for every noise type.
+    """
+    spec = dict({'noise_type': 'white'}, **spec)
+    keys = sorted(spec)
+    result = []
+    seen = set()
+    for combination in product(*[axis(k, spec[k]) for k in keys]):
+        cell = dict(zip(keys, combination))
+        if cell['estimator'] not in ESTIMATORS:
+            raise Exception("Unknown estimator %s!"%(cell['estimator']))
+        if cell['noise_type'] not in ("white", "color"):
+            raise Exception("ERROR: the noise type is wrong!!")
+        if ('snrs' in cell) != (cell['estimator'] in ('cx_snr', 'cm_snr')) or ('snrs' in cell and 'channel' not in cell):
+            raise Exception("The cx_snr and cm_snr estimators, and only them, take snrs, with a channel!")
+        files = tuple(result_files(cell))
+        if files in seen: continue
+        seen.add(files)
+        result.append(cell)
+    return result
+
+def run_cell(cell):
+    """Run all the realizations of the cell, return one list of results per result file."""
+    function, prefix, names, prefixed = ESTIMATORS[cell['estimator']]
+    outputs = [[] for k in names]
+    for i in range(cell['realizations']):
+        receive = load(prefix, cell, i, cell['slicing'])
+        temp = function(receive, cell)
+        if len(names) == 1: temp = (temp,)
+        for k in range(len(names)):
+            outputs[k].append(temp[k])
+    return outputs
+
+def groups(cells):
+    """
+    Split the cells into the tasks of the pool: the cells differing only in the
+    slicing length form one task when the estimator handles all the lengths at once.
+    """
+    result = OrderedDict()
+    for cell in cells:
+        if ESTIMATORS[cell['estimator']][3] is None:
+            key = repr(sorted(cell.items()))
+        else:
+            key = repr(sorted((k, v) for k, v in cell.items() if k != 'slicing'))
+        result.setdefault(key, []).append(cell)
+    return result.values()
+
+def run_group(group):
+    """Run a group of cells, return the outputs of run_cell for every cell."""
+    function, prefix, names, prefixed = ESTIMATORS[group[0]['estimator']]
+    if len(group) == 1 or prefixed is None:
+        return [run_cell(cell) for cell in group]
+    # one pass over the longest slicing, every realization loaded once
+    lengths = [cell['slicing'] for cell in group]
+    outputs = [[[]] for cell in group]
+    for i in range(group[0]['realizations']):
+        receive = load(prefix, group[0], i, max(lengths))
+        for k, temp in enumerate(prefixed(receive, group[0], lengths)):
+            outputs[k][0].append(temp)
+    return outputs
+
+def usage():
+    """(CPU seconds, peak resident set in MB) of this process so far."""
+    temp = resource.getrusage(resource.RUSAGE_SELF)
+    return temp.ru_utime + temp.ru_stime, temp.ru_maxrss/1024.
+
+def task(group):
+    """
+    run_group in a worker; the exception is sent back as text instead of stopping the pool.
+    Return: (group, outputs or None, traceback or None, statistics of the task)
+    """
+    start = time.time()
+    cpu, rss = usage()
+    try:
+        outputs, error = run_group(group), None
+    except Exception:
+        outputs, error = None, traceback.format_exc()
+    wall = time.time() - start
+    # a group of prefixes loads every realization once for all its cells, see run_group
+    prefixed = len(group) > 1 and ESTIMATORS[group[0]['estimator']][3] is not None
+    realizations = group[0]['realizations'] if prefixed else sum(cell['realizations'] for cell in group)
+    # ru_maxrss is the high-water mark of the worker over all its tasks: a task only
+    # raises it above the peak of the earlier tasks
+    now, peak = usage()
+    stats = {'pid': os.getpid(), 'start': start, 'wall': wall, 'cpu': now-cpu,
+             'worker_peak_rss_mb': peak, 'peak_rss_growth_mb': peak-rss,
+             'realizations': realizations, 'realizations_per_s': realizations/max(wall, 1e-9),
+             'results': sum(cell['realizations'] for cell in group)}
+    return group, outputs, error, stats
+
+def write(filename, results):
+    """
+    Write the results of a cell atomically, one '%s\\n' line per realization,
+    or per row when the result of a realization is a matrix.
+    """
+    temp = filename + ".part"
+    with open(temp, 'w') as f:
+        for k in results:
+            for row in (k if np.ndim(k) == 2 else [k]):
+                f.write('%s\n' % row)
+    os.rename(temp, filename)
+
+def done(cell, directory, stored):
+    """Whether the results of the cell are written: its result files, or its records in the store."""
+    if stored is None:
+        return all(os.path.exists(f) for f in result_files(cell, directory))
+    return all(results_store.key(dict(cell, output=k)) in stored for k in range(len(ESTIMATORS[cell['estimator']][2])))
+
+def log_line(f, record):
+    """Append one JSON record to the log f, if any, and flush it, so that the log follows a running sweep."""
+    if f is None: return
+    f.write(json.dumps(record, default=repr) + "\n")
+    f.flush()
+
+def run(spec, directory="result", processes=None, resume=True, store=None, log=None):
+    """
+    Run a sweep.
+        spec - grid spec or list of grid specs, see the module documentation and cells
+        directory - where the result files are written  [default = "result"]
+        processes - size of the pool, 1 runs the cells in this process  [default: number of CPUs]
+        resume - skip the cells whose results are all written  [default = True]
+        store - file of the binary store receiving the results instead of the text
+                files, one record per cell and output  [default: the text files]
+        log - JSON lines file receiving one record per task (cells, wall and CPU
+              time, peak RSS of the worker so far and its growth during the task,
+              realizations processed and per second,
+              results written, one per realization and cell, error) and a
+              summary of the sweep  [default: no log]
+        Return: the number of cells run; if any cell failed, an exception is raised
+                once all the other cells are done
+    """
+    if isinstance(spec, dict): spec = [spec]
+    grid = reduce(lambda acc, k: acc+cells(k), spec, [])
+    stored = None if store is None else results_store.keys(store)
+    pending = [c for c in grid if not (resume and done(c, directory, stored))]
+    print "%d cells, %d to run"%(len(grid), len(pending))
+
+    tasks = groups(pending)
+    logfile = None if log is None else open(log, 'a')
+    start = time.time()
+    cpu = 0.
+    failed = []
+    count = 0
+    job = None
+
+    # the base signals of the regenerated realizations are mapped once for all the workers,
+    # and dropped when the sweep ends
+    channels = [c for c in pending if 'channel' in c]
+    if channels:
+        share(max(c['realizations'] for c in channels), max(c['slicing'] for c in channels))
+    try:
+        if processes != 1:
+            job = Pool(processes)
+        results = (task(group) for group in tasks) if job is None else job.imap_unordered(task, tasks)
+        for group, outputs, error, stats in results:
+            count += len(group)
+            cpu += stats['cpu']
+            log_line(logfile, dict(stats, cells=group, failed=error is not None, error=error))
+            if error is not None:
+                failed += [(cell, error) for cell in group]
+                print >> sys.stderr, "[%d/%d] FAILED"%(count, len(pending)), group[0], "\n", error
+                continue
+            if store is None:
+                for cell, output in zip(group, outputs):
+                    for filename, temp in zip(result_files(cell, directory), output):
+                        write(filename, temp)
+            else:
+                results_store.append(store, [(dict(cell, output=k), temp) for cell, output in zip(group, outputs) \
+                        for k, temp in enumerate(output)])
+            print "[%d/%d] %.1fs %.1f/s"%(count, len(pending), stats['wall'], stats['realizations_per_s']), \
+                    result_files(group[-1], directory)[0]
+        if job is not None:
+            job.close()
+    except BaseException:
+        if job is not None:
+            job.terminate()
+        if logfile is not None: logfile.close()
+        raise
+    finally:
+        if job is not None:
+            job.join()
+        if channels:
+            unshare()
+    wall = time.time() - start
+    log_line(logfile, {'summary': True, 'start': start, 'wall': wall, 'cpu': cpu, 'cells': len(pending),
+            'tasks': len(tasks), 'failed': len(failed), 'processes': processes or cpu_count(),
+            'utilization': cpu/max(wall, 1e-9)/(processes or cpu_count())})
+    if logfile is not None: logfile.close()
+
+    if failed:
+        raise Exception("%d of %d cells failed, the first one: %s\n%s"%(len(failed), len(pending), \
+                failed[0][0], failed[0][1]))
+    return len(pending)